@@ -33,12 +33,41 @@ function setSpinner(on) {
     else { spinner.classList.add('hidden'); sendBtn.disabled = false; }
 }
 
+let toastTimer = null;
 function toast(msg) {
     const t = document.getElementById('toast');
     if (!t) return;
     t.textContent = msg || '';
     t.classList.remove('hidden');
-    setTimeout(() => t.classList.add('hidden'), 2500);
+    clearTimeout(toastTimer);
+    toastTimer = setTimeout(() => t.classList.add('hidden'), 2500);
+}
+
+// Poll the backend's index build progress while a workbook is loading
+let progressTimer = null;
+function watchIndexProgress() {
+    clearInterval(progressTimer);
+    let seen = false;
+    progressTimer = setInterval(async () => {
+        try {
+            const res = await fetch('http://127.0.0.1:8000/progress');
+            if (!res.ok) return;
+            const p = await res.json();
+            if (p.state === 'encoding') {
+                seen = true;
+                const pct = p.rows_total ? Math.floor(100 * p.rows_done / p.rows_total) : 0;
+                const eta = p.eta_seconds != null ? `, ~${Math.ceil(p.eta_seconds)}s left` : '';
+                toast(`Indexing ${p.rows_done}/${p.rows_total} rows (${pct}%, ${Math.round(p.rows_per_sec)} rows/s${eta})`);
+            } else if (seen) {
+                clearInterval(progressTimer);
+            }
+        } catch { /* backend busy or gone; keep polling until reset */ }
+    }, 1000);
+}
+
+function stopIndexProgress() {
+    clearInterval(progressTimer);
+    progressTimer = null;
 }
 
 function escapeHtml(s) {
@@ -698,6 +727,7 @@ web?.addEventListener('message', (ev) => {
                 break;
             }
             case 'reset': {
+                stopIndexProgress();
                 history.length = 0;
                 thinkingIndex = -1;
                 ansEl.innerHTML = '';
@@ -708,6 +738,8 @@ web?.addEventListener('message', (ev) => {
             }
             case 'toast': {
                 toast(msg.message || '');
+                if ((msg.message || '').startsWith('Loading workbook')) watchIndexProgress();
+                else if ((msg.message || '').startsWith('Initialize failed') || (msg.message || '').startsWith('Failed to load workbook')) stopIndexProgress();
                 break;
             }
             default: break;
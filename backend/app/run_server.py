@@ -34,14 +34,20 @@ from pydantic import BaseModel
 from faster_whisper import WhisperModel
 import tempfile
 import shutil
+import multiprocessing
+import threading
 from functools import partial
 
 import uvicorn
 
-from table_main    import rag_pipeline, set_current_chunks, load_excel_data, get_current_chunks
-from llm_embedding import build_index
+from table_main    import rag_pipeline, retrieve_batch, open_workbook, get_current_chunks, retrieval_cache_stats, workbook_registry_stats
+from llm_embedding import build_progress, embedding_store_stats, get_encoder, memory_footprint, pca_report, query_cache_stats
+from llm_embedding import batching_stats, shutdown_encode_pool
+from llm_embedding import model_status as embedding_model_status
+from retrieval import tokenizer_cache_stats
 from table_linearizer import linearize
-from llm_generating import generate_answer
+from llm_generating import generate_answer, get_llm
+from llm_generating import model_status as llm_model_status
 from save_jsonl import LOG_PATH, save_interaction
 
 executor = ThreadPoolExecutor(max_workers=2)
@@ -71,6 +77,18 @@ def get_whisper_model():
         whisper_model = WhisperModel("base", device="cpu", compute_type="int8")
     return whisper_model
 
+def _warm_up_models():
+    """Load the embedding and generation models off the request path"""
+    for name, load in (("embedding", get_encoder), ("llm", get_llm)):
+        try:
+            load()
+        except Exception as e:
+            server_logger.error("Failed to load %s model: %s", name, e)
+    print(f"Models ready: {model_states()}")
+
+def model_states() -> Dict[str, dict]:
+    return {"embedding": embedding_model_status(), "llm": llm_model_status()}
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -80,6 +98,8 @@ async def lifespan(app: FastAPI):
     except Exception:
         pass
     load_formula_templates()
+    # /health answers immediately; /ready turns 200 once the models are loaded
+    threading.Thread(target=_warm_up_models, name="model-warmup", daemon=True).start()
     print("Server started. Waiting for Excel file to be loaded...")
     
     yield
@@ -90,6 +110,7 @@ async def lifespan(app: FastAPI):
     except Exception:
         pass
     executor.shutdown(wait=True)
+    shutdown_encode_pool()
 
 app = FastAPI(title="ExcelRAG Service", lifespan=lifespan)
 
@@ -171,6 +192,7 @@ class ChatRequest(BaseModel):
     snippets: Optional[List[str]] = None
     detailed: Optional[bool] = False
     session_id: Optional[str] = None
+    workbook: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -178,6 +200,20 @@ class ChatResponse(BaseModel):
 class SpeechResponse(BaseModel):
     text: str
 
+class RetrieveBatchRequest(BaseModel):
+    prompts: List[str]
+    k: Optional[int] = None
+    workbook: Optional[str] = None
+
+class RetrievalResult(BaseModel):
+    prompt: str
+    indices: List[int]
+    snippets: List[str]
+    score: float
+
+class RetrieveBatchResponse(BaseModel):
+    results: List[RetrievalResult]
+
 class FormulaRequest(BaseModel):
     prompt: str
     user_selection: Optional[str] = ""
@@ -353,18 +389,16 @@ async def initialize(req: Request):
         if not excel_path or not Path(excel_path).exists():
             raise HTTPException(status_code=400, detail=f"Excel file not found: {excel_path}")
 
-        # Load Excel data
-        chunks = load_excel_data(excel_path)
+        # Reuses the registered index when this exact file was opened before
+        loop = asyncio.get_event_loop()
+        chunks, reused = await loop.run_in_executor(executor, open_workbook, excel_path)
         if not chunks:
             raise HTTPException(status_code=400, detail="No data rows found in the Excel file.")
 
-        build_index(chunks)
-        set_current_chunks(chunks)
-
         global CHUNKS
         CHUNKS = chunks
         
-        return {"status": "index rebuilt", "snippets": len(chunks)}
+        return {"status": "index reused" if reused else "index rebuilt", "snippets": len(chunks)}
     except HTTPException:
         raise
     except Exception as e:
@@ -380,7 +414,7 @@ async def chat(req: ChatRequest):
     try:
         if req.snippets:
             loop = asyncio.get_event_loop()
-            selected_chunks, _ = await loop.run_in_executor(executor, rag_pipeline, req.prompt, req.detailed)
+            selected_chunks, _ = await loop.run_in_executor(executor, rag_pipeline, req.prompt, req.detailed, None, req.workbook)
             
             combined_snippets = req.snippets.copy()
             for chunk in selected_chunks:
@@ -399,7 +433,7 @@ async def chat(req: ChatRequest):
         
         else:
             loop = asyncio.get_event_loop()
-            selected_chunks, raw = await loop.run_in_executor(executor, rag_pipeline, req.prompt, req.detailed)
+            selected_chunks, raw = await loop.run_in_executor(executor, rag_pipeline, req.prompt, req.detailed, None, req.workbook)
             
             if not selected_chunks and "No workbook data available" in raw:
                 raise HTTPException(status_code=400, detail="No workbook has been initialized. Please re-open the Excel file.")
@@ -434,10 +468,52 @@ async def chat(req: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/retrieve/batch", response_model=RetrieveBatchResponse)
+async def retrieve_batch_endpoint(req: RetrieveBatchRequest):
+    """
+    Retrieve evidence snippets for many prompts in one batch (no generation)
+    """
+    try:
+        not_initialized = HTTPException(status_code=400, detail="No workbook has been initialized. Please re-open the Excel file.")
+        if not req.workbook and not get_current_chunks():
+            raise not_initialized
+
+        # Resolving the workbook waits for any index build and may read its
+        # snapshot from disk, so it runs off the event loop
+        loop = asyncio.get_event_loop()
+        results = await loop.run_in_executor(executor, retrieve_batch, req.prompts, req.k, req.workbook)
+        if results is None:
+            raise not_initialized
+
+        return RetrieveBatchResponse(results=[
+            RetrievalResult(prompt=prompt, indices=idxs, snippets=selected, score=best_score)
+            for prompt, (idxs, selected, best_score) in zip(req.prompts, results)
+        ])
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+
+@app.get("/progress")
+async def progress():
+    """Rows encoded by the running index build (polled by the task pane)"""
+    return build_progress()
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once both models are loaded, 503 while warming up"""
+    models = model_states()
+    is_ready = all(m["loaded"] for m in models.values())
+    return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, "models": models})
+
 @app.get("/history")
 def get_history(limit: int = 5) -> List[Dict]:
     if not LOG_PATH.exists():
@@ -644,8 +720,19 @@ def get_status():
         "chunks_loaded": len(current_chunks),
         "formula_templates": len(FORMULA_TEMPLATES),
     "has_index": len(current_chunks) > 0,
-        "sample_chunks": current_chunks[:3] if current_chunks else []
+        "sample_chunks": current_chunks[:3] if current_chunks else [],
+        "query_cache": query_cache_stats(),
+        "retrieval_cache": retrieval_cache_stats(),
+        "stem_cache": tokenizer_cache_stats(),
+        "embedding_store": embedding_store_stats(),
+        "encoder_batching": batching_stats(),
+        "models": model_states(),
+        "workbooks": workbook_registry_stats(),
+        "embedding_memory": memory_footprint(),
+        "pca": pca_report(),
     }
 
 if __name__ == "__main__":
+    # Encoder pool workers are spawned from the frozen executable
+    multiprocessing.freeze_support()
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=False)
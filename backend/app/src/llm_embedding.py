@@ -1,9 +1,21 @@
 import sys, json, os
+import argparse
+import gc
+import hashlib
+import multiprocessing
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
 
+# sentence_transformers pulls in torch; it is imported with the model on first use
+SentenceTransformer = None
+
 if getattr(sys, "frozen", False):
     ROOT = Path(sys.executable).parent
 else:
@@ -12,10 +24,474 @@ else:
 cfg = json.loads((ROOT / "config.json").read_text())
 
 EMBEDDING_MODEL = cfg["EMBEDDING_MODEL"]
+_eb = cfg.get("EMBEDDING_BACKEND", {})
+EMBEDDING_BACKEND = str(_eb.get("TYPE", "torch")).lower()
+ONNX_PATH = _eb.get("ONNX_PATH", str(Path(EMBEDDING_MODEL) / "onnx" / "model_qint8.onnx"))
+MAX_SEQ_LENGTH = int(_eb.get("MAX_SEQ_LENGTH", 256))
+ONNX_BATCH_SIZE = int(_eb.get("BATCH_SIZE", 32))
+ONNX_THREADS = int(_eb.get("THREADS", 0))
+TOKEN_BUDGET = max(1, int(_eb.get("TOKEN_BUDGET", 8192)))
+ENCODE_WORKERS = int(_eb.get("WORKERS", 0))
+POOL_MIN_CHUNKS = int(_eb.get("POOL_MIN_CHUNKS", 20000))
+# Cache key for encoder output; the backends agree only to within tolerance
+ENCODER_ID = EMBEDDING_MODEL if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL}#{EMBEDDING_BACKEND}"
 INDEX_PATH = cfg["INDEX_PATH"]
+_qc = cfg.get("QUERY_CACHE", {})
+QUERY_CACHE_SIZE = int(_qc.get("MAX_SIZE", 256))
+QUERY_CACHE_TTL = float(_qc.get("TTL_SECONDS", 900))
+_ec = cfg.get("EMBEDDING_CACHE", {})
+EMBEDDING_CACHE_ENABLED = bool(_ec.get("ENABLED", True))
+EMBEDDING_CACHE_FILE = _ec.get("FILE", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_MB = float(_ec.get("MAX_MB", 256))
+_fi = cfg.get("FAISS_INDEX", {})
+INDEX_TYPE = str(_fi.get("TYPE", "flat")).lower()
+AUTO_FLAT_MAX_ROWS = int(_fi.get("AUTO_FLAT_MAX_ROWS", 20000))
+AUTO_HNSW_MAX_ROWS = int(_fi.get("AUTO_HNSW_MAX_ROWS", 500000))
+HNSW_M = int(_fi.get("HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(_fi.get("HNSW_EF_CONSTRUCTION", 80))
+HNSW_EF_SEARCH = int(_fi.get("HNSW_EF_SEARCH", 64))
+IVF_NLIST = int(_fi.get("IVF_NLIST", 0))
+IVF_NPROBE = int(_fi.get("IVF_NPROBE", 16))
+PQ_M = int(_fi.get("PQ_M", 48))
+PQ_NBITS = int(_fi.get("PQ_NBITS", 8))
+TRAIN_SAMPLE = int(_fi.get("TRAIN_SAMPLE", 50000))
+STORAGE = str(_fi.get("STORAGE", "float32")).lower()
+PCA_DIM = int(_fi.get("PCA_DIM", 0))
+PCA_TYPE = str(_fi.get("PCA_TYPE", "pca")).lower()
+PCA_REPORT_DIMS = [int(d) for d in _fi.get("PCA_REPORT_DIMS", [32, 64, 128, 192, 256])]
+INCREMENTAL_MAX_CHANGE = float(_fi.get("INCREMENTAL_MAX_CHANGE", 0.5))
+INDEX_MMAP = bool(_fi.get("MMAP", True))
+BUILD_BATCH_SIZE = max(1, int(_fi.get("BUILD_BATCH_SIZE", 1024)))
 
-_encoder = SentenceTransformer(str(ROOT / EMBEDDING_MODEL))
+_encoder = None
+_encoder_lock = threading.Lock()
+_encoder_status: dict = {"loaded": False, "load_seconds": None, "error": None}
 _index = None
+# (mtime, size, inode) of the index file ``_index`` was read from
+_index_sig: tuple | None = None
+_embeddings = None
+_transform = None
+_chunk_ids: np.ndarray | None = None
+_id_lookup: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+# Whether the missing chunk ids of the current index were reported
+_ids_warned = False
+_pca_report: dict = {}
+_index_path_override: Path | None = None
+
+
+def get_encoder():
+    """Return the sentence encoder, loading it on first use.
+
+    ``EMBEDDING_BACKEND.TYPE`` picks PyTorch sentence-transformers ("torch") or
+    the exported int8 model under ONNX Runtime ("onnx").
+    """
+    global _encoder, SentenceTransformer
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                t0 = time.perf_counter()
+                try:
+                    if EMBEDDING_BACKEND == "onnx":
+                        from onnx_encoder import OnnxEncoder
+                        _encoder = OnnxEncoder(
+                            ROOT / EMBEDDING_MODEL, ROOT / ONNX_PATH,
+                            MAX_SEQ_LENGTH, ONNX_BATCH_SIZE, ONNX_THREADS,
+                        )
+                    else:
+                        if SentenceTransformer is None:
+                            from sentence_transformers import SentenceTransformer
+                        _encoder = SentenceTransformer(str(ROOT / EMBEDDING_MODEL))
+                        limit = getattr(_encoder, "max_seq_length", None)
+                        if not isinstance(limit, int) or limit > MAX_SEQ_LENGTH:
+                            _encoder.max_seq_length = MAX_SEQ_LENGTH
+                except Exception as e:
+                    _encoder_status["error"] = str(e)
+                    raise
+                _encoder_status.update(loaded=True, load_seconds=time.perf_counter() - t0, error=None)
+    return _encoder
+
+def model_status() -> dict:
+    """Whether the embedding model is loaded, and how long loading took."""
+    return dict(_encoder_status, loaded=_encoder is not None, model=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND)
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU cache of query embeddings with a TTL.
+
+    Keys are (embedding model id, normalized query text), so the cache never
+    serves a vector produced by a different encoder.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 900.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> np.ndarray | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl > 0 and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1].copy()
+
+    def put(self, key: tuple[str, str], value: np.ndarray) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value.copy())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+def _normalize_query(query: str) -> str:
+    # all-MiniLM-L6-v2 is uncased, so case and spacing never change the vector
+    return " ".join(unicodedata.normalize("NFKC", query or "").split()).casefold()
+
+def query_cache_stats() -> dict:
+    return _query_cache.stats()
+
+
+class EmbeddingStore:
+    """Encoder output persisted in SQLite, keyed by encoder fingerprint + text.
+
+    Survives restarts, so reopening a workbook re-embeds only rows never
+    seen before. Each row carries a last-used stamp; once the stored
+    vectors exceed ``max_bytes`` the least recently used are deleted down to
+    90% of the cap. Thread-safe; any SQLite error degrades to a miss.
+    """
+
+    _BATCH = 500  # stays under SQLite's bound-parameter limit
+
+    def __init__(self, path: Path, max_bytes: int, namespace: str):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Encoder pool workers open the same file; wait out their write locks
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors "
+            "(key BLOB PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL, used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS vectors_used ON vectors(used)")
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM vectors").fetchone()[0]
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.namespace.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(text.encode("utf-8", "surrogatepass"))
+        return h.digest()
+
+    def get_many(self, keys: list[bytes]) -> list[np.ndarray | None]:
+        found: dict[bytes, np.ndarray] = {}
+        now = time.time_ns()
+        with self._lock:
+            try:
+                for i in range(0, len(keys), self._BATCH):
+                    batch = list(dict.fromkeys(keys[i:i + self._BATCH]))
+                    marks = ",".join("?" * len(batch))
+                    for key, dim, vec in self._conn.execute(
+                        f"SELECT key, dim, vec FROM vectors WHERE key IN ({marks})", batch
+                    ):
+                        found[key] = np.frombuffer(vec, dtype=np.float32).reshape(dim)
+                    self._conn.execute(f"UPDATE vectors SET used = ? WHERE key IN ({marks})", [now, *batch])
+            except sqlite3.Error as e:
+                print(f"Warning: Embedding store read failed: {e}")
+            rows = [found.get(k) for k in keys]
+            hits = sum(r is not None for r in rows)
+            self.hits += hits
+            self.misses += len(rows) - hits
+        return rows
+
+    def put_many(self, keys: list[bytes], embs: np.ndarray) -> None:
+        if self.max_bytes <= 0:
+            return
+        embs = np.ascontiguousarray(embs, dtype=np.float32)
+        now = time.time_ns()
+        rows = [(k, int(e.shape[0]), e.tobytes(), now) for k, e in zip(keys, embs)]
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+                self._bytes += sum(len(r[2]) for r in rows)
+                if self._bytes > self.max_bytes:
+                    self._evict()
+            except sqlite3.Error as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                print(f"Warning: Embedding store write failed: {e}")
+
+    def _evict(self) -> None:
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM vectors").fetchone()[0]
+        excess = self._bytes - int(self.max_bytes * 0.9)
+        if excess <= 0:
+            return
+        doomed, freed = [], 0
+        for key, size in self._conn.execute("SELECT key, LENGTH(vec) FROM vectors ORDER BY used"):
+            if freed >= excess:
+                break
+            doomed.append(key)
+            freed += size
+        self._conn.execute("BEGIN")
+        for i in range(0, len(doomed), self._BATCH):
+            batch = doomed[i:i + self._BATCH]
+            self._conn.execute(f"DELETE FROM vectors WHERE key IN ({','.join('?' * len(batch))})", batch)
+        self._conn.execute("COMMIT")
+        self._bytes -= freed
+        self.evicted += len(doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                "bytes": int(self._bytes),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+class BuildProgress:
+    """Rows encoded by the running (or last) index build, for /progress polling.
+
+    ``state`` is idle, encoding, done or failed; throughput and ETA come
+    from the rows encoded since ``start``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = "idle"
+        self._done = 0
+        self._total = 0
+        self._started = 0.0
+        self._ended = 0.0
+        self._error: str | None = None
+
+    def start(self, total: int) -> None:
+        with self._lock:
+            self._state, self._done, self._total, self._error = "encoding", 0, int(total), None
+            self._started = self._ended = time.perf_counter()
+
+    def advance(self, rows: int) -> None:
+        with self._lock:
+            self._done = min(self._total, self._done + int(rows))
+
+    def finish(self, error: str | None = None) -> None:
+        with self._lock:
+            if self._state == "encoding":
+                self._state = "failed" if error else "done"
+                self._error = error
+                self._ended = time.perf_counter()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.perf_counter() if self._state == "encoding" else self._ended
+            elapsed = max(now - self._started, 0.0)
+            rate = self._done / elapsed if elapsed > 0 else 0.0
+            left = self._total - self._done
+            return {
+                "state": self._state,
+                "rows_done": self._done,
+                "rows_total": self._total,
+                "rows_per_sec": rate,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": left / rate if self._state == "encoding" and rate > 0 else None,
+                "error": self._error,
+            }
+
+
+_progress = BuildProgress()
+
+def build_progress() -> dict:
+    return _progress.snapshot()
+
+_store: EmbeddingStore | None = None
+_store_checked = False
+_store_lock = threading.Lock()
+
+def _encoder_fingerprint() -> str | None:
+    """Identity of the encoder weights on disk, or None when they are missing.
+
+    Covers the model directory's top-level files (and the ONNX file for that
+    backend) by name, size and mtime, so replaced weights never match
+    vectors stored for the old ones. MAX_SEQ_LENGTH is part of it too: texts
+    longer than that are truncated, so another limit embeds other tokens.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(ENCODER_ID.encode("utf-8"))
+    # Both backends cut overlong texts from the right at MAX_SEQ_LENGTH tokens
+    h.update(f"\x00max_seq_length={MAX_SEQ_LENGTH}\x00truncation=right\x00".encode("utf-8"))
+    model_dir = ROOT / EMBEDDING_MODEL
+    if not model_dir.is_dir():
+        return None
+    files = sorted(p for p in model_dir.iterdir() if p.is_file())
+    if EMBEDDING_BACKEND == "onnx":
+        files.append(ROOT / ONNX_PATH)
+    try:
+        for f in files:
+            st = f.stat()
+            h.update(f"{f.name}\x00{st.st_size}\x00{st.st_mtime_ns}\x00".encode("utf-8"))
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def embedding_store() -> EmbeddingStore | None:
+    """The on-disk embedding store, opened on first use; None when disabled."""
+    global _store, _store_checked
+    if not _store_checked:
+        with _store_lock:
+            if not _store_checked:
+                namespace = _encoder_fingerprint() if EMBEDDING_CACHE_ENABLED else None
+                if namespace is not None:
+                    path = Path(EMBEDDING_CACHE_FILE)
+                    if not path.is_absolute():
+                        path = _default_index_path().parent / path
+                    try:
+                        _store = EmbeddingStore(path, int(EMBEDDING_CACHE_MAX_MB * 2**20), namespace)
+                    except (sqlite3.Error, OSError) as e:
+                        print(f"Warning: Embedding store unavailable at {path}: {e}")
+                _store_checked = True
+    return _store
+
+def embedding_store_stats() -> dict:
+    store = embedding_store()
+    return store.stats() if store is not None else {"enabled": False}
+
+def _encode_cached(texts: list[str]) -> np.ndarray:
+    """Raw encoder output for ``texts``; the disk store answers what it has seen."""
+    store = embedding_store()
+    if store is None:
+        return _encode_bucketed(texts)
+    keys = [store.key(t) for t in texts]
+    rows = store.get_many(keys)
+    todo: dict[bytes, int] = {}
+    for i, row in enumerate(rows):
+        if row is None:
+            todo.setdefault(keys[i], i)
+    if todo:
+        embs = _encode_bucketed([texts[i] for i in todo.values()])
+        store.put_many(list(todo), embs)
+        fresh = dict(zip(todo, embs))
+        rows = [row if row is not None else fresh[key] for row, key in zip(rows, keys)]
+    if not rows:
+        return np.zeros((0, 384), dtype=np.float32)
+    return np.vstack(rows)
+
+def _token_lengths(encoder, texts: list[str]) -> np.ndarray:
+    """Tokenized length of each text, capped at ``MAX_SEQ_LENGTH``.
+
+    Uses the encoder's own tokenizer when it has one, otherwise a
+    four-characters-per-token estimate.
+    """
+    try:
+        if hasattr(encoder, "token_lengths"):
+            lengths = encoder.token_lengths(texts)
+        else:
+            ids = encoder.tokenizer(list(texts), truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+            lengths = [len(row) for row in ids]
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.shape != (len(texts),):
+            raise ValueError("tokenizer returned the wrong number of lengths")
+    except Exception:
+        lengths = np.fromiter((len(t) // 4 + 2 for t in texts), dtype=np.int64, count=len(texts))
+    return np.clip(lengths, 1, MAX_SEQ_LENGTH)
+
+def _token_batches(lengths: np.ndarray, budget: int) -> list[np.ndarray]:
+    """Positions grouped shortest first into batches of at most ``budget`` padded tokens.
+
+    A batch pads to its longest text, so its cost is rows x longest length;
+    a text longer than the budget on its own still gets a batch.
+    """
+    order = np.argsort(lengths, kind="stable")
+    batches, start = [], 0
+    for end in range(1, len(order) + 1):
+        if end - 1 > start and (end - start) * lengths[order[end - 1]] > budget:
+            batches.append(order[start:end - 1])
+            start = end - 1
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+_batching = {"texts": 0, "batches": 0, "tokens": 0, "padded_tokens": 0}
+_batching_lock = threading.Lock()
+
+def _encode_bucketed(texts: list[str]) -> np.ndarray:
+    """Raw encoder output for ``texts``, in input order.
+
+    Texts are sorted by tokenized length and cut into token-budgeted batches
+    so short rows are not padded out to the width of the widest sheet. Input
+    that fits one budgeted batch goes to the encoder as is.
+    """
+    encoder = get_encoder()
+    if len(texts) < 2:
+        return np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    lengths = _token_lengths(encoder, texts)
+    if len(texts) * int(lengths.max()) <= TOKEN_BUDGET:
+        batches = [np.arange(len(texts))]
+        out = np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    else:
+        batches, out = _token_batches(lengths, TOKEN_BUDGET), None
+        for batch in batches:
+            embs = np.asarray(encoder.encode([texts[i] for i in batch], batch_size=len(batch),
+                                             convert_to_numpy=True), dtype=np.float32)
+            if out is None:
+                out = np.empty((len(texts), embs.shape[1]), dtype=np.float32)
+            out[batch] = embs
+    with _batching_lock:
+        _batching["texts"] += len(texts)
+        _batching["batches"] += len(batches)
+        _batching["tokens"] += int(lengths.sum())
+        _batching["padded_tokens"] += sum(len(b) * int(lengths[b].max()) for b in batches)
+    return out
+
+def batching_stats() -> dict:
+    """Texts, batches and padding efficiency of the length-bucketed encoder calls."""
+    with _batching_lock:
+        stats = dict(_batching)
+    stats["padding_efficiency"] = stats["tokens"] / stats["padded_tokens"] if stats["padded_tokens"] else 1.0
+    stats["token_budget"] = TOKEN_BUDGET
+    stats["max_seq_length"] = MAX_SEQ_LENGTH
+    return stats
 
 def _user_data_dir() -> Path:
     base = os.environ.get("LOCALAPPDATA")
@@ -25,6 +501,11 @@ def _user_data_dir() -> Path:
     return Path.home() / "AppData" / "Local" / "FinLite"
 
 def _resolved_index_path() -> Path:
+    if _index_path_override is not None:
+        return _index_path_override
+    return _default_index_path()
+
+def _default_index_path() -> Path:
     p = Path(INDEX_PATH)
     if p.is_absolute():
         return p
@@ -33,41 +514,873 @@ def _resolved_index_path() -> Path:
         return _user_data_dir() / p.name
     return (ROOT / p)
 
-def build_index(chunks: list[str]) -> None:
-    embs = _encoder.encode(chunks, convert_to_numpy=True)
-    dim = embs.shape[1]
-    idx = faiss.IndexFlatL2(dim)
-    idx.add(embs)
+def _resolved_embeddings_path() -> Path:
+    ip = _resolved_index_path()
+    return ip.with_name(ip.stem + "_embeddings.npy")
+
+def _resolved_ids_path() -> Path:
+    ip = _resolved_index_path()
+    return ip.with_name(ip.stem + "_ids.npy")
+
+def _resolved_spec_path() -> Path:
+    ip = _resolved_index_path()
+    return ip.with_name(ip.stem + "_spec.json")
+
+def workbook_index_path(key: str) -> Path:
+    """Index location for one registered workbook; its sidecar files sit alongside."""
+    base = _default_index_path()
+    return base.parent / "workbooks" / key / base.name
+
+def use_index(index_path: Path | None, index=None, embeddings=None, transform=None, chunk_ids=None) -> None:
+    """Point the module at another workbook's index artifacts.
+
+    ``index_path`` None restores the configured INDEX_PATH. Artifacts passed
+    as None are loaded lazily from the new location.
+    """
+    global _index_path_override, _index, _embeddings, _transform, _index_sig
+    _index_path_override = Path(index_path) if index_path is not None else None
+    _index, _embeddings, _transform = index, embeddings, transform
+    _index_sig = None
+    _set_chunk_ids(chunk_ids)
+
+def index_state() -> tuple:
+    """The (index, embeddings, transform, chunk ids) currently held in memory."""
+    return _index, _embeddings, _transform, _chunk_ids
+
+def _set_chunk_ids(ids: np.ndarray | None) -> None:
+    global _chunk_ids, _id_lookup, _ids_warned
+    _chunk_ids = ids
+    _id_lookup = None
+    _ids_warned = False
+
+def _as_ids(ids, n: int) -> np.ndarray:
+    """Stable FAISS ids for ``n`` chunks; chunk positions when none are given."""
+    if ids is None or len(ids) != n:
+        return np.arange(n, dtype=np.int64)
+    return np.asarray(ids, dtype=np.int64)
+
+def _ids_to_positions(I: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Map FAISS ids back to chunk positions; unknown ids and padding become -1."""
+    global _id_lookup
+    if not len(ids):
+        return np.full_like(I, -1)
+    if _id_lookup is None or _id_lookup[0] is not ids:
+        order = np.argsort(ids, kind="stable")
+        _id_lookup = (ids, order, ids[order])
+    _, order, sorted_ids = _id_lookup
+    at = np.clip(np.searchsorted(sorted_ids, I), 0, len(ids) - 1)
+    return np.where(sorted_ids[at] == I, order[at], -1)
+
+def _resolved_transform_path() -> Path:
+    ip = _resolved_index_path()
+    return ip.with_name(ip.stem + "_transform.bin")
+
+def _l2_normalize(embs: np.ndarray) -> np.ndarray:
+    embs = np.asarray(embs, dtype=np.float32)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return np.ascontiguousarray(embs / (norms + 1e-9), dtype=np.float32)
+
+def _pq_m(dim: int) -> int:
+    # PQ needs the dimension to split evenly into sub-quantizers
+    return max(d for d in range(1, min(PQ_M, dim) + 1) if dim % d == 0)
+
+def _storage_codec(n: int, dim: int, storage: str | None = None) -> str | None:
+    """index_factory vector encoding for ``storage``, or None for float32.
+
+    float16 and sq8 (int8 scalar quantization) cut the 4 bytes/dim of
+    float32 to 2 and 1; pq keeps PQ_M bytes per vector. PQ falls back to
+    sq8 when there are too few rows to train its codebooks.
+    """
+    storage = (storage or STORAGE).lower()
+    if storage in ("float16", "fp16"):
+        return "SQfp16"
+    if storage in ("sq8", "int8"):
+        return "SQ8"
+    if storage == "pq":
+        if n >= 39 * (1 << PQ_NBITS):
+            return f"PQ{_pq_m(dim)}x{PQ_NBITS}"
+        return "SQ8"
+    return None
+
+def _index_description(n: int, dim: int, kind: str | None = None, storage: str | None = None) -> str:
+    """Pick a FAISS index_factory description for ``n`` vectors of ``dim``.
+
+    ``kind`` is one of flat, hnsw, ivf_flat, ivf_pq or auto (by row count).
+    IVF variants degrade gracefully when there are too few rows to train.
+    ``storage`` (float32, float16, sq8 or pq) sets how the vectors are
+    encoded; ivf_pq is always product-quantized.
+    """
+    kind = (kind or INDEX_TYPE).lower()
+    codec = _storage_codec(n, dim, storage)
+    if kind == "auto":
+        if n <= AUTO_FLAT_MAX_ROWS:
+            kind = "flat"
+        elif n <= AUTO_HNSW_MAX_ROWS:
+            kind = "hnsw"
+        else:
+            kind = "ivf_pq"
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M},{codec}" if codec else f"HNSW{HNSW_M}"
+    if kind in ("ivf_flat", "ivf_pq"):
+        # FAISS wants ~39 training points per centroid
+        nlist = IVF_NLIST or int(4 * np.sqrt(max(n, 1)))
+        nlist = min(nlist, n // 39)
+        if nlist < 1:
+            return codec or "Flat"
+        if kind == "ivf_pq" and n >= 39 * (1 << PQ_NBITS):
+            return f"IVF{nlist},PQ{_pq_m(dim)}x{PQ_NBITS}"
+        return f"IVF{nlist},{codec or 'Flat'}"
+    return codec or "Flat"
+
+def _index_spec(n: int, dim: int) -> dict:
+    """The index ``build_index`` makes for ``n`` vectors of encoder ``dim`` under the current config.
+
+    IVF centroid counts derived from the row count are left out: they drift
+    with every update without changing the index structure.
+    """
+    reduce = 0 < PCA_DIM < min(dim, n)
+    factory = _index_description(n, PCA_DIM if reduce else dim)
+    if factory.startswith("IVF") and not IVF_NLIST:
+        factory = "IVF," + factory.split(",", 1)[1]
+    return {
+        "dim": int(dim),
+        "factory": factory,
+        "storage": STORAGE,
+        "pca": f"{PCA_TYPE}{PCA_DIM}" if reduce else None,
+    }
+
+def load_index_spec(index_path: Path | None = None) -> dict | None:
+    """The spec the index at ``index_path`` (default: the current location) was built to, if recorded."""
+    ip = Path(index_path) if index_path is not None else _resolved_index_path()
+    path = ip.with_name(ip.stem + "_spec.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Failed to load index spec from {path}: {e}")
+        return None
+
+def index_spec_mismatch(spec: dict | None, n: int) -> str | None:
+    """Why an index built to ``spec`` differs from what ``build_index`` would build for ``n`` rows now."""
+    if not isinstance(spec, dict) or not isinstance(spec.get("dim"), int):
+        return "index spec unknown"
+    if spec != _index_spec(n, spec["dim"]):
+        return "index config changed"
+    return None
+
+def _make_index(n: int, dim: int, kind: str | None = None):
+    # Vectors are L2-normalized, so inner product is cosine similarity
+    idx = faiss.index_factory(dim, _index_description(n, dim, kind), faiss.METRIC_INNER_PRODUCT)
+    hnsw = getattr(idx, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return idx
+
+def _sample_rows(n: int) -> np.ndarray:
+    """Sorted positions of at most TRAIN_SAMPLE rows, the same for every call."""
+    if n > TRAIN_SAMPLE:
+        return np.sort(np.random.default_rng(0).choice(n, TRAIN_SAMPLE, replace=False))
+    return np.arange(n)
+
+def _training_sample(embs: np.ndarray) -> np.ndarray:
+    n = embs.shape[0]
+    if n > TRAIN_SAMPLE:
+        embs = embs[_sample_rows(n)]
+    return np.ascontiguousarray(embs, dtype=np.float32)
+
+def _train_index(idx, embs: np.ndarray) -> None:
+    if idx.is_trained:
+        return
+    idx.train(_training_sample(embs))
+
+def _make_transform(dim: int, out_dim: int, n: int, kind: str | None = None):
+    """PCA (or OPQ rotation + projection) from ``dim`` down to ``out_dim``.
+
+    OPQ needs enough rows to train its PQ codebooks and falls back to PCA.
+    """
+    kind = (kind or PCA_TYPE).lower()
+    if kind == "opq" and n >= 39 * 256:
+        return faiss.OPQMatrix(dim, _pq_m(out_dim), out_dim)
+    return faiss.PCAMatrix(dim, out_dim)
+
+def _fit_transform(embs: np.ndarray, out_dim: int, kind: str | None = None):
+    tr = _make_transform(embs.shape[1], out_dim, embs.shape[0], kind)
+    tr.train(_training_sample(embs))
+    return tr
+
+def _project(embs: np.ndarray, transform=None) -> np.ndarray:
+    """Apply the fitted reduction; unchanged when there is none.
+
+    The projection is re-normalized so inner product stays cosine.
+    """
+    transform = transform if transform is not None else load_transform()
+    if transform is None:
+        return embs
+    return _l2_normalize(transform.apply(_l2_normalize(embs)))
+
+def pca_recall_curve(embs: np.ndarray, dims: list[int] | None = None, k: int = 10, n_queries: int = 200) -> list[dict]:
+    """Recall@k of exact search after reducing to each of ``dims``.
+
+    Ground truth is exact search at full dimension; queries are sampled
+    from ``embs`` itself. Dimensions that are not below the input dimension
+    or the row count are skipped; the full dimension closes the curve.
+    """
+    base = _l2_normalize(_training_sample(embs))
+    n, dim = base.shape
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    q_ids = rng.choice(n, min(n_queries, n), replace=False)
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(base)
+    _, truth = exact.search(base[q_ids], k)
+    curve = []
+    for d in sorted(set(dims if dims is not None else PCA_REPORT_DIMS)):
+        if not 0 < d < min(dim, n):
+            continue
+        reduced = _project(base, _fit_transform(base, d))
+        approx = faiss.IndexFlatIP(d)
+        approx.add(reduced)
+        _, found = approx.search(reduced[q_ids], k)
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+        curve.append({"dim": d, "recall_at_k": hits / (len(q_ids) * k), "bytes_per_vector": 4 * d})
+    curve.append({"dim": dim, "recall_at_k": 1.0, "bytes_per_vector": 4 * dim})
+    return curve
+
+def _base_index(idx):
+    """Unwrap pre-transform / id-map wrappers down to the index that searches."""
+    while isinstance(idx, (faiss.IndexPreTransform, faiss.IndexIDMap, faiss.IndexIDMap2)):
+        idx = faiss.downcast_index(idx.index)
+    return idx
+
+def _search_params(idx, k: int, nprobe: int | None = None, ef_search: int | None = None, sel=None):
+    """Per-call search parameters, so concurrent searches never mutate the index."""
+    base = _base_index(idx)
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=nprobe or IVF_NPROBE)
+    if isinstance(base, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=max(ef_search or HNSW_EF_SEARCH, k))
+    if isinstance(base, faiss.IndexPQ):
+        # IndexPQ rejects the generic parameter class
+        return faiss.SearchParametersPQ(sel=sel)
+    return faiss.SearchParameters(sel=sel)
+
+def _encode_rows(chunks: list[str], rows: np.ndarray) -> np.ndarray:
+    """Normalized encoder output for ``chunks[rows]``, counted in the build progress."""
+    embs = _l2_normalize(_encode_cached([chunks[i] for i in rows]))
+    _progress.advance(len(rows))
+    return embs
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _pool_init(threads: int) -> None:
+    # Each worker gets an even share of the cores and its own encoder
+    global ONNX_THREADS
+    ONNX_THREADS = threads
+    if EMBEDDING_BACKEND != "onnx":
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    get_encoder()
+
+def _pool_encode(texts: list[str], use_store: bool = True) -> np.ndarray:
+    if use_store:
+        return _l2_normalize(_encode_cached(texts))
+    return _l2_normalize(_encode_bucketed(texts))
+
+def encode_pool(workers: int | None = None) -> ProcessPoolExecutor | None:
+    """The encoder worker processes, started on first use; None when WORKERS < 2.
+
+    Workers load the model once and are kept for later builds; a request
+    for a different worker count replaces the pool.
+    """
+    global _pool, _pool_workers
+    workers = ENCODE_WORKERS if workers is None else workers
+    if workers < 2:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_pool_init, initargs=(threads,),
+            )
+            _pool_workers = workers
+        return _pool
+
+def shutdown_encode_pool() -> None:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool, _pool_workers = None, 0
+
+def _encode_batches(chunks: list[str], batches, pool: ProcessPoolExecutor | None = None, use_store: bool = True):
+    """Yield (rows, normalized embeddings) per batch of row positions, in order.
+
+    With a pool, up to two batches per worker are in flight; the caller
+    consumes results while the workers encode ahead.
+    """
+    if pool is None:
+        for rows in batches:
+            yield rows, _encode_rows(chunks, rows)
+        return
+    inflight: deque = deque()
+    for rows in batches:
+        inflight.append((rows, pool.submit(_pool_encode, [chunks[i] for i in rows], use_store)))
+        if len(inflight) >= 2 * _pool_workers:
+            done, fut = inflight.popleft()
+            embs = fut.result()
+            _progress.advance(len(done))
+            yield done, embs
+    while inflight:
+        done, fut = inflight.popleft()
+        embs = fut.result()
+        _progress.advance(len(done))
+        yield done, embs
+
+def _build_pool(n: int) -> ProcessPoolExecutor | None:
+    return encode_pool() if n >= POOL_MIN_CHUNKS else None
+
+def benchmark_encoding(texts: list[str], worker_counts=(1, 2, 4, 8), batch_size: int | None = None) -> list[dict]:
+    """Encoding throughput (rows/sec) of ``texts`` for each worker count.
+
+    Bypasses the embedding store so every row is really encoded; 1 means
+    the in-process encoder. Pool start-up (model loading) is excluded by a
+    warm-up batch per worker.
+    """
+    batch_size = batch_size or BUILD_BATCH_SIZE
+    batches = [np.arange(i, min(i + batch_size, len(texts))) for i in range(0, len(texts), batch_size)]
+    results = []
+    for workers in worker_counts:
+        pool = encode_pool(workers) if workers > 1 else None
+        if pool is not None:
+            list(pool.map(_pool_encode, [texts[:1]] * workers, [False] * workers))
+        else:
+            get_encoder()
+        t0 = time.perf_counter()
+        for _ in _encode_batches(texts, batches, pool, use_store=False):
+            pass
+        dt = time.perf_counter() - t0
+        results.append({"workers": workers, "rows": len(texts), "seconds": dt, "rows_per_sec": len(texts) / dt if dt > 0 else 0.0})
+    shutdown_encode_pool()
+    return results
+
+def build_index(chunks: list[str], ids=None) -> None:
+    """Encode every chunk and write a fresh index.
+
+    ``ids`` are the chunks' stable FAISS ids (see ``update_index``); chunk
+    positions are used when they are not given. Chunks stream through in
+    BUILD_BATCH_SIZE batches that are added to the index and written to a
+    memory-mapped embedding file as they go, so peak memory is one batch
+    plus, for index types that train (and for PCA), a TRAIN_SAMPLE-row
+    sample encoded first. Workbooks of POOL_MIN_CHUNKS rows or more are
+    encoded by the WORKERS-process pool (``encode_pool``) when one is
+    configured. Progress is published for ``build_progress``.
+    """
+    _progress.start(len(chunks))
+    try:
+        _build_index(chunks, _as_ids(ids, len(chunks)))
+    except Exception as e:
+        _progress.finish(str(e))
+        raise
+    _progress.finish()
+
+def _batches(rows: np.ndarray) -> list[np.ndarray]:
+    return [rows[i:i + BUILD_BATCH_SIZE] for i in range(0, len(rows), BUILD_BATCH_SIZE)]
+
+def _release_mapped() -> None:
+    """Drop the module's references to memory-mapped artifacts.
+
+    Windows refuses to replace a file that is still mapped, so this runs
+    before the index or embedding files are rewritten.
+    """
+    global _index, _embeddings, _index_sig
+    _index = _embeddings = _index_sig = None
+    _set_chunk_ids(None)
+    gc.collect()
+
+def _build_index(chunks: list[str], ids: np.ndarray) -> None:
+    global _index, _embeddings, _transform, _pca_report, _index_sig
+    _release_mapped()
+    n = len(chunks)
+    pool = _build_pool(n)
     out_path = _resolved_index_path()
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(idx, str(out_path))
+
+    first = np.arange(min(BUILD_BATCH_SIZE, n))
+    first_embs = _encode_rows(chunks, first)
+    dim = first_embs.shape[1]
+    reduce = 0 < PCA_DIM < min(dim, n)
+    out_dim = PCA_DIM if reduce else dim
+    idx = faiss.IndexIDMap2(_make_index(n, out_dim))
+
+    # Training (PCA/OPQ, IVF centroids, SQ ranges, PQ codebooks) needs a
+    # sample drawn from the whole workbook before anything is added
+    pending = [(first, first_embs)]
+    if reduce or not idx.is_trained:
+        sample = _sample_rows(n)
+        pending.extend(_encode_batches(chunks, _batches(np.setdiff1d(sample, first)), pool))
+        rows = np.concatenate([r for r, _ in pending])
+        embs = np.vstack([e for _, e in pending])
+        train = embs[np.isin(rows, sample)]
+    else:
+        train = None
+
+    # Optional PCA/OPQ reduction, fitted on this workbook and persisted so
+    # encode_query can project queries into the same space
+    _transform = None
+    _pca_report = {}
+    tp = _resolved_transform_path()
+    if reduce:
+        curve = pca_recall_curve(train, PCA_REPORT_DIMS + [PCA_DIM])
+        _transform = _fit_transform(train, PCA_DIM)
+        train = _project(train, _transform)
+        faiss.write_VectorTransform(_transform, str(tp))
+        _pca_report = {"type": PCA_TYPE, "dim": PCA_DIM, "k": 10, "curve": curve}
+        print("PCA recall@10 by dim: " + ", ".join(f"{c['dim']}={c['recall_at_k']:.3f}" for c in curve))
+    elif tp.exists():
+        tp.unlink()
+    if train is not None:
+        _train_index(idx, train)
+        train = None
+
+    # Rows land in a memory-mapped .npy as they are added, not in a list
+    emb_path = _resolved_embeddings_path()
+    tmp_path = emb_path.with_name(emb_path.name + ".tmp")
+    out = np.lib.format.open_memmap(
+        str(tmp_path), mode="w+", dtype=np.float32 if STORAGE == "float32" else np.float16, shape=(n, out_dim)
+    )
+    done = np.zeros(n, dtype=bool)
+
+    def emit(rows: np.ndarray, embs: np.ndarray) -> None:
+        if reduce:
+            embs = _project(embs, _transform)
+        idx.add_with_ids(embs, ids[rows])
+        out[rows] = embs
+        done[rows] = True
+
+    for rows, embs in pending:
+        emit(rows, embs)
+    pending = None
+    for rows, embs in _encode_batches(chunks, _batches(np.flatnonzero(~done)), pool):
+        emit(rows, embs)
+
+    out.flush()
+    del out
+    _index, _index_sig = idx, None
+    _replace_file(out_path, lambda tmp: faiss.write_index(idx, str(tmp)))
+    os.replace(tmp_path, emb_path)
+    _embeddings = np.load(str(emb_path), mmap_mode="r" if INDEX_MMAP else None)
+    _set_chunk_ids(ids)
+    spec = _index_spec(n, dim)
+    for path, write in (
+        (_resolved_ids_path(), lambda tmp: _save_npy(tmp, ids)),
+        (_resolved_spec_path(), lambda tmp: tmp.write_text(json.dumps(spec), encoding="utf-8")),
+    ):
+        try:
+            _replace_file(path, write)
+        except Exception as e:
+            print(f"Warning: Failed to save {path}: {e}")
+    _print_footprint()
+
+def _save_rows(embs: np.ndarray, ids: np.ndarray) -> None:
+    """Keep the normalized matrix and the chunk ids, row-aligned with chunks.
+
+    The matrix serves reranking and incremental updates; compact storage
+    modes keep it in half precision.
+    """
+    global _embeddings
+    _embeddings = embs if STORAGE == "float32" else embs.astype(np.float16)
+    _set_chunk_ids(ids)
+    for path, arr in ((_resolved_embeddings_path(), _embeddings), (_resolved_ids_path(), ids)):
+        try:
+            _replace_file(path, lambda tmp: _save_npy(tmp, arr))
+        except Exception as e:
+            print(f"Warning: Failed to save {path}: {e}")
+
+def _save_npy(path: Path, arr: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, arr)
+
+def _replace_file(path: Path, write) -> None:
+    """Write ``path`` through a temporary sibling and rename it into place.
+
+    Processes that memory-mapped the old file keep reading the old contents
+    instead of a half-written one.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+def _print_footprint() -> None:
+    fp = memory_footprint()
+    print(
+        f"Embedding storage {fp['storage']}: index {fp['index_bytes'] / 2**20:.1f} MiB, "
+        f"embeddings {fp['embeddings_bytes'] / 2**20:.1f} MiB (float32 {fp['float32_bytes'] / 2**20:.1f} MiB)"
+    )
+
+def _incremental_blocker(idx, embs: np.ndarray | None, ids: np.ndarray | None, n: int) -> str | None:
+    """Why the stored artifacts cannot be updated in place to ``n`` rows, or None if they can."""
+    if idx is None or embs is None:
+        return "no previous index"
+    if not isinstance(idx, faiss.IndexIDMap2):
+        return "index has no id map"
+    if ids is None:
+        return "chunk ids missing"
+    if not (idx.ntotal == len(ids) == embs.shape[0]) or idx.d != embs.shape[1]:
+        return "index files out of sync"
+    # FAISS_INDEX settings, or the structure ``auto`` picks for this many rows, changed
+    return index_spec_mismatch(load_index_spec(), n)
+
+def update_index(chunks: list[str], ids) -> dict:
+    """Bring the index at the current location in line with ``chunks``.
+
+    Chunks keep their stored vector when their stable id (sheet, row and
+    content hash) is already in the index; only new or edited rows are
+    encoded and added, and ids that disappeared are removed with
+    ``remove_ids``. Falls back to ``build_index`` when there is no usable
+    previous index, when the index was built to another FAISS_INDEX config
+    (or ``auto`` would now pick another structure for the new row count),
+    when more than INCREMENTAL_MAX_CHANGE of the rows are new or edited (so
+    IVF centroids and PCA are refitted), or when rows must be deleted from an
+    HNSW graph, which cannot delete.
+    """
+    global _index, _index_sig
+    ids = _as_ids(ids, len(chunks))
+    # Mutate a private copy: a memory-mapped index is read-only
+    try:
+        idx = _read_index(_resolved_index_path(), mmap=False)
+    except Exception as e:
+        print(f"Warning: Failed to load index from {_resolved_index_path()}: {e}")
+        idx = None
+    old_embs, old_ids = load_embeddings(), load_chunk_ids()
+    reason = _incremental_blocker(idx, old_embs, old_ids, len(ids))
+    if reason is None:
+        known = np.isin(ids, old_ids)
+        removed = np.setdiff1d(old_ids, ids)
+        changed = int((~known).sum())
+        if changed > INCREMENTAL_MAX_CHANGE * max(len(ids), 1):
+            reason = f"{changed} of {len(ids)} rows changed"
+        elif len(removed) and isinstance(_base_index(idx), faiss.IndexHNSW):
+            reason = "HNSW cannot remove rows"
+    if reason is not None:
+        # The mapped embeddings file is about to be replaced
+        del old_embs, old_ids
+        build_index(chunks, ids)
+        return {"mode": "rebuild", "reason": reason, "encoded": len(chunks), "removed": 0}
+
+    embs = np.empty((len(ids), old_embs.shape[1]), dtype=np.float32)
+    order = np.argsort(old_ids, kind="stable")
+    embs[known] = old_embs[order[np.searchsorted(old_ids[order], ids[known])]]
+    del old_embs, old_ids
+    _release_mapped()
+    new_rows = np.flatnonzero(~known)
+    if len(new_rows):
+        _progress.start(len(new_rows))
+        try:
+            batches = _encode_batches(chunks, _batches(new_rows), _build_pool(len(new_rows)))
+            fresh = _project(np.vstack([e for _, e in batches]))
+        except Exception as e:
+            _progress.finish(str(e))
+            raise
+        _progress.finish()
+        if fresh.shape[1] != embs.shape[1]:
+            build_index(chunks, ids)
+            return {"mode": "rebuild", "reason": "embedding dimension changed", "encoded": len(chunks), "removed": 0}
+        embs[new_rows] = fresh
+    if len(removed):
+        idx.remove_ids(removed)
+    if len(new_rows):
+        idx.add_with_ids(embs[new_rows], ids[new_rows])
+    _index, _index_sig = idx, None
+    _replace_file(_resolved_index_path(), lambda tmp: faiss.write_index(idx, str(tmp)))
+    _save_rows(embs, ids)
+    print(f"Index updated in place: {len(new_rows)} rows encoded, {len(removed)} removed, {len(ids) - len(new_rows)} reused")
+    return {"mode": "incremental", "encoded": int(len(new_rows)), "removed": int(len(removed))}
+
+def _mmap_flags() -> list[int]:
+    # IO_FLAG_MMAP_IFC maps flat codes without copying; IO_FLAG_MMAP covers
+    # IVF lists on FAISS builds that lack it or cannot map a given type
+    return [f for f in (getattr(faiss, "IO_FLAG_MMAP_IFC", None), getattr(faiss, "IO_FLAG_MMAP", None)) if f]
+
+def _read_index(path: Path, mmap: bool | None = None):
+    """Read an index file, memory-mapped when ``mmap`` (default MMAP) allows.
+
+    A mapped index shares the OS page cache and loads without reading the
+    file, but it is read-only; None when the file does not exist.
+    """
+    if not path.exists():
+        return None
+    if INDEX_MMAP if mmap is None else mmap:
+        for flag in _mmap_flags():
+            try:
+                return faiss.read_index(str(path), flag)
+            except RuntimeError:
+                continue
+    return faiss.read_index(str(path))
+
+def _file_sig(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
 
 def load_index():
-    global _index
+    """Return the index at the current location, loading it on first use.
+
+    A file replaced on disk since it was read (a rebuild by another process)
+    is picked up on the next call, together with the embeddings, transform
+    and chunk ids written alongside it.
+    """
+    global _index, _embeddings, _transform, _index_sig
+    path = _resolved_index_path()
+    if _index is not None:
+        sig = _file_sig(path)
+        if _index_sig is None:
+            _index_sig = sig
+        elif sig is not None and sig != _index_sig:
+            print(f"Index file {path} changed on disk; reloading")
+            _index = _embeddings = _transform = None
+            _set_chunk_ids(None)
     if _index is None:
         try:
-            ip = _resolved_index_path()
-            if ip.exists():
-                _index = faiss.read_index(str(ip))
-            else:
+            _index = _read_index(path)
+            if _index is None:
                 return None
         except Exception as e:
-            print(f"Warning: Failed to load index from {_resolved_index_path()}: {e}")
+            print(f"Warning: Failed to load index from {path}: {e}")
             return None
+        _index_sig = _file_sig(path)
     return _index
 
+def load_embeddings() -> np.ndarray | None:
+    """Return the L2-normalized chunk embeddings, row-aligned with the chunks.
+
+    With MMAP on, the matrix is a read-only memory map of the ``.npy`` file.
+    """
+    global _embeddings
+    if _embeddings is None:
+        try:
+            ep = _resolved_embeddings_path()
+            if ep.exists():
+                _embeddings = np.load(str(ep), mmap_mode="r" if INDEX_MMAP else None)
+            else:
+                return None
+        except Exception as e:
+            print(f"Warning: Failed to load embeddings from {_resolved_embeddings_path()}: {e}")
+            return None
+    return _embeddings
+
+def load_chunk_ids() -> np.ndarray | None:
+    """Return the stable FAISS id of each chunk, row-aligned with the chunks."""
+    if _chunk_ids is None:
+        try:
+            path = _resolved_ids_path()
+            if path.exists():
+                _set_chunk_ids(np.load(str(path)))
+        except Exception as e:
+            print(f"Warning: Failed to load chunk ids from {_resolved_ids_path()}: {e}")
+            return None
+    return _chunk_ids
+
+def load_transform():
+    """Return the fitted PCA/OPQ transform, or None when the index is unreduced."""
+    global _transform
+    if _transform is None:
+        try:
+            tp = _resolved_transform_path()
+            if tp.exists():
+                _transform = faiss.read_VectorTransform(str(tp))
+        except Exception as e:
+            print(f"Warning: Failed to load transform from {_resolved_transform_path()}: {e}")
+            return None
+    return _transform
+
+def pca_report() -> dict:
+    """Recall-vs-dimension curve measured when the transform was fitted."""
+    return _pca_report
+
+def memory_footprint() -> dict:
+    """Bytes held by the FAISS index and the rerank embeddings.
+
+    ``float32_bytes`` is what the same vectors take uncompressed. The index
+    size is that of the serialized file, which tracks its in-memory size.
+    """
+    ip = _resolved_index_path()
+    try:
+        index_bytes = ip.stat().st_size if ip.exists() else 0
+    except OSError:
+        index_bytes = 0
+    embs = _embeddings
+    if embs is not None:
+        n, dim = embs.shape
+    elif _index is not None:
+        n, dim = int(_index.ntotal), int(_index.d)
+    else:
+        n = dim = 0
+    return {
+        "storage": STORAGE,
+        "mmap": INDEX_MMAP,
+        "vectors": int(n),
+        "dim": int(dim),
+        "index_bytes": int(index_bytes),
+        "embeddings_bytes": int(embs.nbytes) if embs is not None else 0,
+        "float32_bytes": int(n) * int(dim) * 4,
+    }
+
 def encode_query(query: str) -> np.ndarray:
-    return _encoder.encode([query], convert_to_numpy=True)
+    return encode_queries([query])
+
+def encode_queries(queries: list[str]) -> np.ndarray:
+    """Encode queries in one encoder batch; cached queries skip the encoder.
+
+    The cache holds raw encoder output, so the index's PCA/OPQ transform (if
+    any) is applied on the way out.
+    """
+    keys = [(ENCODER_ID, _normalize_query(q)) for q in queries]
+    rows: list[np.ndarray | None] = [_query_cache.get(key) for key in keys]
+    todo: dict[tuple[str, str], int] = {}
+    for i, row in enumerate(rows):
+        if row is None:
+            todo.setdefault(keys[i], i)
+    if todo:
+        embs = _encode_bucketed([queries[i] for i in todo.values()])
+        fresh = {key: embs[j:j + 1] for j, key in enumerate(todo)}
+        for key, emb in fresh.items():
+            _query_cache.put(key, emb)
+        rows = [row if row is not None else fresh[key] for row, key in zip(rows, keys)]
+    if not rows:
+        return np.zeros((0, 384), dtype=np.float32)
+    return _project(np.vstack(rows))
 
-def search_index(q_emb: np.ndarray, k: int) -> list[int]:
+def search_index(
+    q_emb: np.ndarray,
+    k: int,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    allowed_ids: np.ndarray | None = None,
+) -> tuple[list[int], list[float]]:
+    """Search the index and return (chunk ids, cosine similarities).
+
+    ``nprobe``/``ef_search`` override the configured IVF/HNSW search breadth
+    and are ignored by index types that lack them. ``allowed_ids`` restricts
+    the search to those chunk ids. FAISS pads with id -1 when fewer than
+    ``k`` hits exist.
+    """
+    ids, sims = search_index_many(q_emb[:1], k, nprobe, ef_search, allowed_ids)
+    return (ids[0], sims[0]) if ids else ([], [])
+
+def search_index_many(
+    q_embs: np.ndarray,
+    k: int,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    allowed_ids: np.ndarray | None = None,
+) -> tuple[list[list[int]], list[list[float]]]:
+    """Search all rows of ``q_embs`` in one FAISS call, one result list per row."""
     idx = load_index()
     if idx is None:
-        return []
-    _, I = idx.search(q_emb, k)
-    return I[0].tolist()
+        return [[] for _ in range(len(q_embs))], [[] for _ in range(len(q_embs))]
+    sel = None
+    q = _l2_normalize(q_embs)
+    # Id-mapped indexes hold stable chunk ids; callers deal in chunk positions
+    ids = load_chunk_ids() if isinstance(idx, faiss.IndexIDMap2) else None
+    if ids is None and isinstance(idx, faiss.IndexIDMap2):
+        return _search_embeddings(q, k, int(idx.ntotal), allowed_ids)
+    if allowed_ids is not None:
+        allowed_ids = np.asarray(allowed_ids, dtype=np.int64)
+        k = max(1, min(k, len(allowed_ids)))
+        stored = ids[allowed_ids] if ids is not None else allowed_ids
+        if isinstance(_base_index(idx), faiss.IndexPQ):
+            # IndexPQ has no selector support: score the allowed codes directly
+            D = q @ idx.reconstruct_batch(stored).T
+            top = np.argsort(-D, axis=1, kind="stable")[:, :k]
+            return allowed_ids[top].tolist(), np.take_along_axis(D, top, axis=1).tolist()
+        sel = faiss.IDSelectorBatch(stored)
+    params = _search_params(idx, k, nprobe, ef_search, sel)
+    D, I = idx.search(q, k, params=params)
+    if ids is not None:
+        I = _ids_to_positions(I, ids)
+    if idx.metric_type == faiss.METRIC_L2:
+        # Index from an older build: squared L2 between unit vectors
+        D = 1.0 - D / 2.0
+    return I.tolist(), D.tolist()
+
+def _search_embeddings(
+    q: np.ndarray, k: int, n: int, allowed_ids: np.ndarray | None
+) -> tuple[list[list[int]], list[list[float]]]:
+    """Exact search over the stored embeddings, for an id-mapped index whose chunk ids are lost.
+
+    The index's hits cannot be mapped back to chunk positions, but the
+    embeddings are row-aligned with the chunks. ``update_index`` rebuilds
+    such an index on the next initialize.
+    """
+    global _ids_warned
+    embs = load_embeddings()
+    usable = embs is not None and embs.shape[0] == n
+    if not _ids_warned:
+        _ids_warned = True
+        fallback = "searching the stored embeddings exhaustively" if usable else "no vector hits"
+        print(f"Warning: Chunk ids {_resolved_ids_path()} missing for an id-mapped index; {fallback} until it is rebuilt")
+    rows = np.asarray(allowed_ids, dtype=np.int64) if allowed_ids is not None else np.arange(n)
+    k = min(k, len(rows))
+    if not usable or k < 1:
+        return [[] for _ in range(len(q))], [[] for _ in range(len(q))]
+    D = q @ np.asarray(embs[rows], dtype=np.float32).T
+    top = np.argsort(-D, axis=1, kind="stable")[:, :k]
+    return rows[top].tolist(), np.take_along_axis(D, top, axis=1).tolist()
 
 def encode_texts(texts: list[str]) -> np.ndarray:
     """Batch-encode a list of texts and return a 2D numpy array (n, d)."""
     if not texts:
         return np.zeros((0, 384), dtype=np.float32)
-    return _encoder.encode(texts, convert_to_numpy=True)
+    return _project(_encode_cached(texts))
+
+def _synthetic_rows(n: int) -> list[str]:
+    """``n`` linearized rows of varying width, standing in for a workbook."""
+    return [
+        f"[Sheet{i % 7}] Row: {i} | " + " | ".join(f"Col{j}: {i * (j + 1)}" for j in range(1 + i % 12))
+        for i in range(n)
+    ]
+
+def main(argv: list[str] | None = None) -> int:
+    """``python -m llm_embedding benchmark --workers 1,2,4``, run from ``src``.
+
+    Prints ``benchmark_encoding`` rows/sec per worker count as JSON, to pick
+    EMBEDDING_BACKEND.WORKERS for a machine.
+    """
+    parser = argparse.ArgumentParser(prog="llm_embedding", description="Embedding encoder tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="encoding throughput per encoder worker count")
+    bench.add_argument("--workers", default="1,2,4", help="comma-separated worker counts (1 = in-process)")
+    bench.add_argument("--texts", type=Path, help="file with one text per line (default: synthetic rows)")
+    bench.add_argument("--rows", type=int, default=5000, help="number of synthetic rows without --texts")
+    bench.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        worker_counts = [int(w) for w in args.workers.split(",") if w.strip()]
+    except ValueError:
+        parser.error(f"--workers must be comma-separated integers, got {args.workers!r}")
+    if not worker_counts or min(worker_counts) < 1:
+        parser.error("--workers needs at least one count of 1 or more")
+    if args.texts is not None:
+        texts = [t for t in args.texts.read_text(encoding="utf-8").splitlines() if t.strip()]
+    else:
+        texts = _synthetic_rows(args.rows)
+    print(json.dumps(benchmark_encoding(texts, worker_counts, args.batch_size), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    # Spawned pool workers re-import this module as __mp_main__; only the parent runs the CLI
+    sys.exit(main())
@@ -1,8 +1,11 @@
 from pathlib import Path
 import json
-from llama_cpp import Llama
 import sys
 import threading
+import time
+
+# llama_cpp is imported with the model on first use
+Llama = None
 
 if getattr(sys, "frozen", False):
     ROOT = Path(sys.executable).parent
@@ -14,15 +17,41 @@ MODEL_PATH = str((ROOT / cfg["MODEL_PATH"]))
 LLM_PARAMS = cfg["LLM_PARAMS"]
 LLM_PARAMS_DETAILED = cfg.get("LLM_PARAMS_DETAILED", LLM_PARAMS)
 
-_llm = Llama(model_path=MODEL_PATH, **{k: v for k, v in LLM_PARAMS.items() if k != "max_tokens"})
+_llm = None
 _llm_lock = threading.Lock()
+_load_lock = threading.Lock()
+_llm_status: dict = {"loaded": False, "load_seconds": None, "error": None}
+
+
+def get_llm():
+    """Return the GGUF model, loading it on first use."""
+    global _llm, Llama
+    if _llm is None:
+        with _load_lock:
+            if _llm is None:
+                t0 = time.perf_counter()
+                try:
+                    if Llama is None:
+                        from llama_cpp import Llama
+                    _llm = Llama(model_path=MODEL_PATH, **{k: v for k, v in LLM_PARAMS.items() if k != "max_tokens"})
+                except Exception as e:
+                    _llm_status["error"] = str(e)
+                    raise
+                _llm_status.update(loaded=True, load_seconds=time.perf_counter() - t0, error=None)
+    return _llm
+
+
+def model_status() -> dict:
+    """Whether the generation model is loaded, and how long loading took."""
+    return dict(_llm_status, loaded=_llm is not None, model=MODEL_PATH)
 
 
 def generate_answer(prompt: str, detailed: bool = False) -> str:
     params = LLM_PARAMS_DETAILED if detailed else LLM_PARAMS
-    
+    llm = get_llm()
+
     with _llm_lock:
-        resp = _llm(
+        resp = llm(
             prompt,
             max_tokens=params.get("max_tokens"),
             stop=params.get("stop")
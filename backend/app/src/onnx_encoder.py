@@ -0,0 +1,219 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# int8 weights move MiniLM embeddings slightly; below this cosine to the
+# torch output, retrieval rankings start to change
+DEFAULT_MIN_COSINE = 0.98
+
+# Linearized rows of mixed width, as table_linearizer produces them
+SAMPLE_TEXTS = [
+    "[Summary] Region: North | Revenue: 1200 | Cost: 800",
+    "[Summary] Region: South | Revenue: 950 | Cost: 610",
+    "[Sales] Date: 2024-01-31 | Product: Widget A | Units: 120 | Price: 9.99 | Discount: 0.05 | Channel: Online",
+    "[Sales] Date: 2024-02-29 | Product: Widget B | Units: 87 | Price: 14.5 | Discount: 0 | Channel: Retail",
+    "[Budget] Department: Marketing | Q1: 25000 | Q2: 27000 | Q3: 26000 | Q4: 31000 | Total: 109000 | Variance: -4.2%",
+    "[Notes] Comment: Freight costs rose after the carrier renegotiated its fuel surcharge in March",
+    "[Headcount] Team: Finance | FTE: 12",
+    "[Cash] Month: June | Opening: 410000 | Receipts: 220500 | Payments: 198300 | Closing: 432200",
+] * 16
+
+
+class OnnxEncoder:
+    """Sentence encoder that runs an exported (optionally int8) MiniLM with ONNX Runtime.
+
+    Mirrors the slice of the ``SentenceTransformer`` API this backend uses:
+    ``encode(texts, batch_size=..., convert_to_numpy=True)`` returning float32
+    rows. Pooling and normalization follow the model's ``modules.json`` so the
+    output matches the torch pipeline.
+    """
+
+    def __init__(self, model_dir: str | Path, onnx_path: str | Path,
+                 max_seq_length: int = 256, batch_size: int = 32, threads: int = 0):
+        if not Path(onnx_path).exists():
+            raise FileNotFoundError(f"{onnx_path} not found; create it with `python -m onnx_encoder export`")
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        self.batch_size = int(batch_size)
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(max_seq_length))
+        self.tokenizer.enable_padding()
+        self.normalize = _uses_normalize(model_dir)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(str(onnx_path), opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size: int | None = None, convert_to_numpy: bool = True, **_) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batch_size = batch_size or self.batch_size
+        out = [self._encode_batch(sentences[i:i + batch_size]) for i in range(0, len(sentences), batch_size)]
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(out)
+
+    def token_lengths(self, texts: list[str]) -> list[int]:
+        """Tokenized (truncated) length of each text, without padding."""
+        return [sum(e.attention_mask) for e in self.tokenizer.encode_batch(list(texts))]
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        enc = self.tokenizer.encode_batch(list(texts))
+        mask = np.asarray([e.attention_mask for e in enc], dtype=np.int64)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.asarray([e.type_ids for e in enc], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        return mean_pool(hidden, mask, self.normalize)
+
+
+def mean_pool(hidden: np.ndarray, mask: np.ndarray, normalize: bool = True) -> np.ndarray:
+    """Mask-aware mean over the token axis, as sentence-transformers' Pooling does."""
+    m = mask[..., None].astype(np.float32)
+    pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+    if normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+def _uses_normalize(model_dir: Path) -> bool:
+    modules = model_dir / "modules.json"
+    if not modules.exists():
+        return True
+    return any(m.get("type", "").endswith("Normalize") for m in json.loads(modules.read_text()))
+
+
+def export_onnx(model_dir: str | Path, onnx_path: str | Path, quantize: bool = True) -> Path:
+    """Export the transformer from ``model_dir`` to ONNX, then int8-quantize its weights.
+
+    Needs torch and transformers, so it runs once at packaging time, never in
+    the server.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    model = AutoModel.from_pretrained(str(model_dir)).eval()
+    sample = AutoTokenizer.from_pretrained(str(model_dir))(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    fp32_path = onnx_path.with_name(onnx_path.stem + "_fp32.onnx") if quantize else onnx_path
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[n] for n in names), str(fp32_path),
+            input_names=names, output_names=["last_hidden_state"],
+            dynamic_axes=axes, opset_version=14,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(fp32_path), str(onnx_path), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+    return onnx_path
+
+
+def compare_encoders(reference, candidate, texts: list[str], repeats: int = 3) -> dict:
+    """Agreement and throughput of ``candidate`` against ``reference`` on ``texts``.
+
+    Reports the worst per-row cosine and absolute difference between the two
+    sets of embeddings, plus texts/second for each encoder (best of ``repeats``).
+    """
+    def timed(encoder):
+        best, embs = float("inf"), None
+        for _ in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            embs = np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+            best = min(best, time.perf_counter() - t0)
+        return embs, len(texts) / best if best > 0 else float("inf")
+
+    ref, ref_tps = timed(reference)
+    cand, cand_tps = timed(candidate)
+    unit = lambda x: x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+    cos = np.sum(unit(ref) * unit(cand), axis=1)
+    return {
+        "n": len(texts),
+        "min_cosine": float(cos.min()) if len(cos) else 1.0,
+        "mean_cosine": float(cos.mean()) if len(cos) else 1.0,
+        "max_abs_diff": float(np.abs(ref - cand).max()) if ref.size else 0.0,
+        "reference_texts_per_sec": ref_tps,
+        "candidate_texts_per_sec": cand_tps,
+        "speedup": cand_tps / ref_tps if ref_tps else float("inf"),
+    }
+
+
+def _app_root() -> Path:
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).parent
+    return Path(__file__).resolve().parent.parent
+
+
+def _load_reference(model_dir: Path):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(str(model_dir))
+
+
+def main(argv: list[str] | None = None) -> int:
+    """``python -m onnx_encoder export|compare``, run from ``src`` at packaging time.
+
+    ``export`` writes the int8 model that ``EMBEDDING_BACKEND.TYPE`` "onnx"
+    loads; ``compare`` checks it against the torch model and exits non-zero
+    when the embeddings disagree beyond ``--min-cosine``. Timings vary with
+    machine load, so the speedup only fails the check when ``--min-speedup``
+    is set above 0.
+    """
+    root = _app_root()
+    cfg = json.loads((root / "config.json").read_text())
+    eb = cfg.get("EMBEDDING_BACKEND", {})
+    model_dir = root / cfg["EMBEDDING_MODEL"]
+    onnx_path = root / eb.get("ONNX_PATH", str(Path(cfg["EMBEDDING_MODEL"]) / "onnx" / "model_qint8.onnx"))
+
+    parser = argparse.ArgumentParser(prog="onnx_encoder", description="Export or check the ONNX embedding backend.")
+    parser.add_argument("--model-dir", type=Path, default=model_dir)
+    parser.add_argument("--onnx", type=Path, default=onnx_path)
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export and int8-quantize the model to --onnx")
+    export.add_argument("--no-quantize", action="store_true")
+    compare = sub.add_parser("compare", help="compare the ONNX model with the torch model")
+    compare.add_argument("--texts", type=Path, help="file with one text per line (default: built-in sample rows)")
+    compare.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE)
+    compare.add_argument("--min-speedup", type=float, default=0.0)
+    compare.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(f"Wrote {export_onnx(args.model_dir, args.onnx, quantize=not args.no_quantize)}")
+        return 0
+
+    texts = SAMPLE_TEXTS
+    if args.texts is not None:
+        texts = [t for t in args.texts.read_text(encoding="utf-8").splitlines() if t.strip()]
+    candidate = OnnxEncoder(args.model_dir, args.onnx, int(eb.get("MAX_SEQ_LENGTH", 256)),
+                            int(eb.get("BATCH_SIZE", 32)), int(eb.get("THREADS", 0)))
+    report = compare_encoders(_load_reference(args.model_dir), candidate, texts, repeats=args.repeats)
+    print(json.dumps(report, indent=2))
+    failures = []
+    if report["min_cosine"] < args.min_cosine:
+        failures.append(f"min cosine {report['min_cosine']:.4f} < {args.min_cosine}")
+    if report["speedup"] < args.min_speedup:
+        failures.append(f"speedup {report['speedup']:.2f}x < {args.min_speedup}x")
+    elif report["speedup"] < 1.0:
+        print(f"Note: ONNX measured slower than torch ({report['speedup']:.2f}x)")
+    for f in failures:
+        print(f"FAIL: {f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
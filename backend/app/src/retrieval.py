@@ -1,17 +1,29 @@
-import math
 import re
 import unicodedata
-from collections import Counter, defaultdict
-from typing import List, Tuple
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
 import numpy as np
+from scipy import sparse
 
 try:
-    from llm_embedding import encode_query, encode_texts, load_index, search_index
+    from llm_embedding import (
+        encode_queries,
+        encode_query,
+        encode_texts,
+        load_embeddings,
+        load_index,
+        search_index,
+        search_index_many,
+    )
 except Exception:
+    encode_queries = None  # type: ignore
     encode_query = None  # type: ignore
     encode_texts = None  # type: ignore
+    load_embeddings = None  # type: ignore
     load_index = None  # type: ignore
     search_index = None  # type: ignore
+    search_index_many = None  # type: ignore
 from pathlib import Path
 import json
 import sys
@@ -27,10 +39,20 @@ try:
     DEFAULT_BM25_TOP_MULT = _r.get("BM25_TOP_MULT", 5)
     DEFAULT_W_BM25 = _r.get("WEIGHT_BM25", 0.5)
     DEFAULT_W_EMBED = _r.get("WEIGHT_EMBED", 0.5)
+    DEFAULT_BM25_MODE = _r.get("BM25_MODE", "maxscore")
+    DEFAULT_FUSION = _r.get("FUSION", "weighted")
+    DEFAULT_RRF_K = _r.get("RRF_K", 60)
+    DEFAULT_PREFILTER = _r.get("METADATA_PREFILTER", True)
+    DEFAULT_RANGE_BOOST = _r.get("RANGE_BOOST", 0.5)
 except Exception:
     DEFAULT_BM25_TOP_MULT = 5
     DEFAULT_W_BM25 = 0.5
     DEFAULT_W_EMBED = 0.5
+    DEFAULT_BM25_MODE = "maxscore"
+    DEFAULT_FUSION = "weighted"
+    DEFAULT_RRF_K = 60
+    DEFAULT_PREFILTER = True
+    DEFAULT_RANGE_BOOST = 0.5
 
 
 try:
@@ -82,6 +104,10 @@ except Exception:
         return tok
 
 
+# Workbook vocabularies are small and repetitive, so stems are memoized
+_stem = lru_cache(maxsize=1 << 16)(_maybe_stem)
+
+
 def _normalize_text(text: str) -> str:
     return unicodedata.normalize("NFKC", text or "")
 
@@ -93,58 +119,504 @@ def _tokenize(text: str) -> List[str]:
     splitter = _TOKEN_SPLIT[1]
     toks = [t for t in splitter.split(text) if t]
     toks = [t for t in toks if t not in _STOPWORDS and not t.isnumeric()]
-    toks = [_maybe_stem(t) for t in toks]
+    toks = [_stem(t) for t in toks]
     return toks
 
 
+def tokenize_batch(texts: List[str]) -> List[List[str]]:
+    """``_tokenize`` over many texts in one pass.
+
+    Each distinct surface token is filtered and stemmed once for the whole
+    batch, which is how the corpus is tokenized at ingest.
+    """
+    splitter = _TOKEN_SPLIT[1]
+    seen: dict = {}
+    out: List[List[str]] = []
+    for text in texts:
+        row: List[str] = []
+        if text:
+            for t in splitter.split(_normalize_text(text).lower()):
+                if not t:
+                    continue
+                stem = seen.get(t, False)
+                if stem is False:
+                    stem = None if t in _STOPWORDS or t.isnumeric() else _stem(t)
+                    seen[t] = stem
+                if stem is not None:
+                    row.append(stem)
+        out.append(row)
+    return out
+
+
+def tokenizer_cache_stats() -> dict:
+    return _stem.cache_info()._asdict()
+
+
 class BM25:
+    """BM25 over a fixed corpus, backed by sparse term-frequency matrices.
+
+    Tokenization, the vocabulary, document lengths and the idf table are all
+    computed once in the constructor, so one instance can be built per
+    workbook (see ``table_main.set_current_chunks``) and reused for every
+    query until the chunks change.
+
+    ``tf`` is the (N, V) CSR term-frequency matrix. Because the BM25
+    contribution of a term to a document does not depend on the query, the
+    per-(doc, term) weights are precomputed into ``weights``, stored
+    column-major so a query only touches the columns of its own terms; each
+    column is that term's postings list.
+    """
+
     def __init__(self, corpus: List[str], k1: float = 1.5, b: float = 0.75):
         self.k1 = k1
         self.b = b
-        self.corpus_tokens: List[List[str]] = [_tokenize(doc) for doc in corpus]
-        self.doc_freq: defaultdict[str, int] = defaultdict(int)
+        self.corpus_tokens: List[List[str]] = tokenize_batch(corpus)
         self.doc_len: List[int] = [len(toks) for toks in self.corpus_tokens]
         self.N = len(corpus)
-        for toks in self.corpus_tokens:
-            for term in set(toks):
-                self.doc_freq[term] += 1
         self.avgdl = (sum(self.doc_len) / self.N) if self.N > 0 else 0.0
 
-        self.idf: dict[str, float] = {}
-        for term, df in self.doc_freq.items():
-            self.idf[term] = math.log(1 + (self.N - df + 0.5) / (df + 0.5))
+        self.vocab: dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        data: List[int] = []
+        for toks in self.corpus_tokens:
+            for term, f in Counter(toks).items():
+                indices.append(self.vocab.setdefault(term, len(self.vocab)))
+                data.append(f)
+            indptr.append(len(indices))
+        V = len(self.vocab)
+        self.tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(self.N, V),
+        )
+
+        df = np.bincount(self.tf.indices, minlength=V).astype(np.float64)
+        self.idf_vec = np.log(1 + (self.N - df + 0.5) / (df + 0.5))
+        self.doc_freq: dict[str, int] = {t: int(df[j]) for t, j in self.vocab.items()}
+        self.idf: dict[str, float] = {t: float(self.idf_vec[j]) for t, j in self.vocab.items()}
+
+        # Per-document length normalisation, k1 * (1 - b + b * dl / avgdl)
+        dl = np.asarray(self.doc_len, dtype=np.float64)
+        denom = self.k1 * (1 - self.b + self.b * dl / (self.avgdl + 1e-9))
+        rows = np.repeat(np.arange(self.N), np.diff(self.tf.indptr))
+        f = self.tf.data
+        w = self.idf_vec[self.tf.indices] * (f * (self.k1 + 1)) / (f + denom[rows])
+        self.weights = sparse.csr_matrix((w, self.tf.indices, self.tf.indptr), shape=self.tf.shape).tocsc()
+        # Per-term score upper bounds for MaxScore pruning in top_k
+        self.max_weight = np.zeros(V, dtype=np.float64)
+        nonempty = np.diff(self.weights.indptr) > 0
+        if nonempty.any():
+            self.max_weight[nonempty] = np.maximum.reduceat(self.weights.data, self.weights.indptr[:-1][nonempty])
+
+    def _query_columns(self, query: str) -> np.ndarray:
+        cols = {self.vocab[t] for t in _tokenize(query) if t in self.vocab}
+        return np.fromiter(sorted(cols), dtype=np.int64, count=len(cols))
+
+    def _column(self, j: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.weights.indptr[j], self.weights.indptr[j + 1]
+        return self.weights.indices[lo:hi], self.weights.data[lo:hi]
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (doc ids, BM25 weights) for ``term``, doc ids ascending."""
+        j = self.vocab.get(term)
+        if j is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return self._column(j)
+
+    def score_array(self, query: str) -> np.ndarray:
+        """Score every document for ``query`` as a float64 array of shape (N,)."""
+        cols = self._query_columns(query)
+        if cols.size == 0 or self.N == 0:
+            return np.zeros(self.N, dtype=np.float64)
+        return np.asarray(self.weights[:, cols].sum(axis=1)).ravel()
 
     def score(self, query: str) -> List[float]:
-        q_toks = _tokenize(query)
-        if not q_toks or self.N == 0:
-            return [0.0] * self.N
-        scores = [0.0] * self.N
-        q_counts = Counter(q_toks)
-        for i, doc_toks in enumerate(self.corpus_tokens):
-            if not doc_toks:
+        return self.score_array(query).tolist()
+
+    def jaccard(self, query: str, doc_ids: np.ndarray) -> np.ndarray:
+        """Token-set Jaccard between ``query`` and ``doc_ids`` from the cached tf rows."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        n_query = len(set(_tokenize(query)))
+        cols = self._query_columns(query)
+        if doc_ids.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        doc_terms = np.diff(self.tf.indptr)[doc_ids]
+        if cols.size:
+            inter = np.asarray((self.tf[doc_ids][:, cols] > 0).sum(axis=1)).ravel()
+        else:
+            inter = np.zeros(doc_ids.size, dtype=np.int64)
+        union = np.maximum(n_query + doc_terms - inter, 1)
+        return (inter / union).astype(np.float32)
+
+    def score_docs(self, query: str, doc_ids: np.ndarray) -> np.ndarray:
+        """Score only ``doc_ids`` for ``query`` by binary search in the postings."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        scores = np.zeros(doc_ids.size, dtype=np.float64)
+        for j in self._query_columns(query):
+            ids, w = self._column(j)
+            if ids.size == 0:
                 continue
-            freq = Counter(doc_toks)
-            dl = self.doc_len[i]
-            denom = self.k1 * (1 - self.b + self.b * dl / (self.avgdl + 1e-9))
-            s = 0.0
-            for t, qtf in q_counts.items():
-                if t not in freq:
-                    continue
-                f = freq[t]
-                idf = self.idf.get(t, 0.0)
-                s += idf * (f * (self.k1 + 1)) / (f + denom)
-            scores[i] = s
+            pos = np.minimum(np.searchsorted(ids, doc_ids), ids.size - 1)
+            hit = ids[pos] == doc_ids
+            scores[hit] += w[pos[hit]]
         return scores
 
+    def top_k(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (doc ids, scores) of the ``k`` best matching documents.
 
-def _normalize(xs: List[float]) -> List[float]:
-    if not xs:
-        return []
-    mn = min(xs)
-    mx = max(xs)
-    if mx - mn < 1e-9:
-        return [0.5 for _ in xs]
-    return [(x - mn) / (mx - mn) for x in xs]
+        Term-at-a-time MaxScore: query terms are processed in decreasing order
+        of their upper bound. Once the bound of the unprocessed terms falls
+        below the current k-th best score, unseen documents can no longer
+        enter the top-k, so the remaining postings are only probed for the
+        surviving candidates instead of being traversed. Only documents
+        matching at least one query term are returned, best first.
+        ``allowed`` optionally restricts the search to those doc ids.
+        """
+        cols = self._query_columns(query)
+        if k <= 0 or cols.size == 0 or self.N == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        mask = None
+        if allowed is not None:
+            mask = np.zeros(self.N, dtype=bool)
+            mask[allowed] = True
+        ub = self.max_weight[cols]
+        order = np.argsort(-ub, kind="stable")
+        cols, ub = cols[order], ub[order]
+        # remaining[i] = upper bound of all terms after the i-th one
+        remaining = np.append(np.cumsum(ub[::-1])[::-1][1:], 0.0)
+        processed = np.cumsum(ub)
+
+        acc = np.zeros(self.N, dtype=np.float64)
+        cand: Optional[np.ndarray] = None  # set once unseen docs are ruled out
+        for i, j in enumerate(cols):
+            ids, w = self._column(j)
+            if mask is not None:
+                keep = mask[ids]
+                ids, w = ids[keep], w[keep]
+            if cand is None:
+                acc[ids] += w
+                # The k-th best score among this term's postings is a cheap
+                # lower bound on the global k-th best score.
+                if (
+                    ids.size >= k
+                    and remaining[i] < processed[i]
+                    and remaining[i] < np.partition(acc[ids], ids.size - k)[ids.size - k]
+                ):
+                    cand = np.flatnonzero(acc)
+            elif ids.size:
+                pos = np.minimum(np.searchsorted(ids, cand), ids.size - 1)
+                hit = ids[pos] == cand
+                acc[cand[hit]] += w[pos[hit]]
+            if cand is not None and cand.size > k:
+                cand_acc = acc[cand]
+                theta = np.partition(cand_acc, cand.size - k)[cand.size - k]
+                cand = cand[cand_acc + remaining[i] >= theta]
+
+        if cand is None:
+            cand = np.flatnonzero(acc)
+        top = _top_indices(acc[cand], k)
+        return cand[top], acc[cand[top]]
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """Score many queries in one sparse matrix product.
+
+        Returns an array of shape (len(queries), N).
+        """
+        if not queries or self.N == 0:
+            return np.zeros((len(queries), self.N), dtype=np.float64)
+        indptr = [0]
+        indices: List[int] = []
+        for q in queries:
+            cols = self._query_columns(q)
+            indices.extend(cols.tolist())
+            indptr.append(len(indices))
+        Q = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(queries), self.weights.shape[1]),
+        )
+        return (Q @ self.weights.T).toarray()
+
+
+_NUM_RE = r"[-+]?\$?\d[\d,]*(?:\.\d+)?(?:\s*(?:%|k|mm|mn|m|bn|b|thousand|million|billion)(?!\w))?"
+_DATE_RE = r"\d{4}-\d{1,2}(?:-\d{1,2})?|\d{1,2}/\d{1,2}/\d{4}"
+_VAL = rf"({_DATE_RE}|{_NUM_RE})"
+_SCALE = {
+    "%": 0.01, "k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "mn": 1e6,
+    "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9,
+}
+# Longer phrasings first: matched spans are blanked so ">=" is not re-read as ">"
+_RANGE_OPS = [
+    (re.compile(rf"\bbetween\s+{_VAL}\s+and\s+{_VAL}"), "between"),
+    (re.compile(rf"\bfrom\s+{_VAL}\s+(?:to|until|through)\s+{_VAL}"), "between"),
+    (re.compile(rf"(?:>=|≥|\bat least|\bno less than|\bnot less than)\s*{_VAL}"), "ge"),
+    (re.compile(rf"(?:<=|≤|\bat most|\bno more than|\bnot more than|\bup to)\s*{_VAL}"), "le"),
+    (re.compile(rf"(?:>|\babove|\bover|\bmore than|\bgreater than|\bhigher than|\bexceeding|\bexceeds)\s*{_VAL}"), "gt"),
+    (re.compile(rf"(?:<|\bbelow|\bunder|\bless than|\blower than|\bfewer than|\bsmaller than)\s*{_VAL}"), "lt"),
+    (re.compile(rf"\b(?:after|later than)\s+{_VAL}"), "after"),
+    (re.compile(rf"\bsince\s+{_VAL}"), "since"),
+    (re.compile(rf"\b(?:before|earlier than|prior to)\s+{_VAL}"), "before"),
+    (re.compile(rf"\b(?:until|through)\s+{_VAL}"), "until"),
+    (re.compile(rf"\b(?:in|during|on)\s+{_VAL}"), "on"),
+]
+_DAY_NS = 86_400 * 10**9
+
+
+def _parse_number(text: str) -> Optional[float]:
+    m = re.fullmatch(r"([-+]?)\$?([\d,]+(?:\.\d+)?)\s*([a-z%]*)", text.strip())
+    if not m or m.group(3) not in _SCALE and m.group(3):
+        return None
+    try:
+        value = float(m.group(2).replace(",", ""))
+    except ValueError:
+        return None
+    value *= _SCALE.get(m.group(3), 1.0)
+    return -value if m.group(1) == "-" else value
+
+
+def _parse_period(text: str) -> Optional[Tuple[int, int]]:
+    """[start, end) in epoch nanoseconds of a date, month or bare year."""
+    text = text.strip()
+    try:
+        if re.fullmatch(r"\d{1,2}/\d{1,2}/\d{4}", text):
+            mo, d, y = (int(p) for p in text.split("/"))
+            text = f"{y:04d}-{mo:02d}-{d:02d}"
+        if re.fullmatch(r"\d{4}-\d{1,2}-\d{1,2}", text):
+            y, mo, d = (int(p) for p in text.split("-"))
+            start = np.datetime64(f"{y:04d}-{mo:02d}-{d:02d}", "D")
+            return int(start.astype("datetime64[ns]").astype(np.int64)), int(
+                (start + 1).astype("datetime64[ns]").astype(np.int64))
+        if re.fullmatch(r"\d{4}-\d{1,2}", text):
+            y, mo = (int(p) for p in text.split("-"))
+            start = np.datetime64(f"{y:04d}-{mo:02d}", "M")
+        elif re.fullmatch(r"(?:1[89]|2\d)\d\d", text):
+            start = np.datetime64(text, "Y")
+        else:
+            return None
+        return int(start.astype("datetime64[ns]").astype(np.int64)), int(
+            (start + 1).astype("datetime64[ns]").astype(np.int64))
+    except ValueError:
+        return None
+
+
+_Predicate = Tuple[str, Optional[float], Optional[float], bool, bool]
+
+
+def _parse_predicates(query: str) -> List[List[_Predicate]]:
+    """Numeric and date predicates in ``query`` as (kind, lo, hi, lo_incl, hi_incl).
+
+    ``kind`` is "num" or "date"; date bounds are epoch nanoseconds. Comparison
+    words ("above", "at most") read their operand as a number, time words
+    ("before", "during") as a date or year. "between"/"from ... to" over bare
+    years is ambiguous, so each entry lists its readings in preference order.
+    """
+    text = _normalize_text(query).lower()
+    preds: List[List[_Predicate]] = []
+    for pattern, op in _RANGE_OPS:
+        for m in pattern.finditer(text):
+            vals = [v for v in m.groups() if v is not None]
+            nums = [_parse_number(v) for v in vals]
+            periods = [_parse_period(v) for v in vals]
+            if op == "between":
+                readings: List[_Predicate] = []
+                if None not in periods:
+                    lo, hi = sorted(periods)
+                    readings.append(("date", lo[0], hi[1], True, False))
+                if None not in nums:
+                    readings.append(("num", min(nums), max(nums), True, True))
+                if readings:
+                    preds.append(readings)
+            elif op in ("gt", "ge", "lt", "le"):
+                if nums[0] is not None:
+                    preds.append([{
+                        "gt": ("num", nums[0], None, False, False),
+                        "ge": ("num", nums[0], None, True, False),
+                        "lt": ("num", None, nums[0], False, False),
+                        "le": ("num", None, nums[0], False, True),
+                    }[op]])
+                elif periods[0] is not None:
+                    start, end = periods[0]
+                    preds.append([{
+                        "gt": ("date", end, None, True, False),
+                        "ge": ("date", start, None, True, False),
+                        "lt": ("date", None, start, False, False),
+                        "le": ("date", None, end, False, False),
+                    }[op]])
+            elif periods[0] is not None:
+                start, end = periods[0]
+                preds.append([{
+                    "after": ("date", end, None, True, False),
+                    "since": ("date", start, None, True, False),
+                    "before": ("date", None, start, False, False),
+                    "until": ("date", None, end, False, False),
+                    "on": ("date", start, end, True, False),
+                }[op]])
+        text = pattern.sub(lambda m: " " * len(m.group(0)), text)
+    return preds
+
+
+class RangeIndex:
+    """Sorted values of a workbook's typed numeric and date columns.
+
+    ``_tokenize`` drops numbers, so BM25 and the embeddings cannot resolve
+    "revenue above 2M". Each numeric/datetime column is kept as a sorted
+    array alongside the chunk id of every value, so a predicate becomes two
+    ``searchsorted`` calls and a slice. Dates are stored as epoch
+    nanoseconds.
+    """
+
+    def __init__(self):
+        self.columns: List[Tuple[str, str, str, np.ndarray, np.ndarray]] = []
+        self._col_toks: List[frozenset] = []
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def add_sheet(self, name: str, df, start: int) -> None:
+        """Index the typed columns of ``df``, whose row ``i`` is chunk ``start + i``."""
+        for col in df.keys():
+            values = np.asarray(df[col])
+            if values.ndim != 1:
+                continue
+            if values.dtype.kind in "iuf":
+                kind = "num"
+                values = values.astype(np.float64)
+                valid = ~np.isnan(values)
+            elif values.dtype.kind == "M":
+                kind = "date"
+                valid = ~np.isnat(values)
+                values = values.astype("datetime64[ns]").astype(np.int64)
+            else:
+                continue
+            rows = np.flatnonzero(valid)
+            order = np.argsort(values[rows], kind="stable")
+            self.add_column(name, str(col), kind, values[rows][order], rows[order] + start)
+
+    def add_column(self, sheet: str, column: str, kind: str, values: np.ndarray, row_ids: np.ndarray) -> None:
+        """Register one column; ``values`` must be sorted ascending."""
+        self.columns.append((sheet, column, kind, values, np.asarray(row_ids, dtype=np.int64)))
+        self._col_toks.append(frozenset(_tokenize(column)))
+
+    def match(self, query: str) -> Optional[np.ndarray]:
+        """Chunk ids satisfying every predicate in ``query``, or None if none apply.
+
+        A numeric predicate applies to the numeric columns the query names;
+        a date predicate to the named date columns, or to every date column
+        when none is named.
+        """
+        if not self.columns:
+            return None
+        preds = _parse_predicates(query)
+        if not preds:
+            return None
+        q = set(_tokenize(query))
+        named = [bool(toks) and toks <= q for toks in self._col_toks]
+        result: Optional[np.ndarray] = None
+        for readings in preds:
+            for kind, lo, hi, lo_incl, hi_incl in readings:
+                cols = self._columns_for(kind, named)
+                if cols:
+                    break
+            else:
+                continue
+            hits = []
+            for i in cols:
+                values, row_ids = self.columns[i][3], self.columns[i][4]
+                a = 0 if lo is None else np.searchsorted(values, lo, side="left" if lo_incl else "right")
+                b = len(values) if hi is None else np.searchsorted(values, hi, side="right" if hi_incl else "left")
+                hits.append(row_ids[a:b])
+            ids = np.unique(np.concatenate(hits))
+            result = ids if result is None else np.intersect1d(result, ids, assume_unique=True)
+        return result
+
+    def _columns_for(self, kind: str, named: List[bool]) -> List[int]:
+        cols = [i for i, c in enumerate(self.columns) if c[2] == kind and named[i]]
+        if not cols and kind == "date":
+            cols = [i for i, c in enumerate(self.columns) if c[2] == kind]
+        return cols
+
+
+class WorkbookMetadata:
+    """Sheet names, column headers and chunk row ranges recorded at ingest.
+
+    Sheet ``i`` owns the chunks ``[start, end)``. ``match`` narrows a
+    question to the sheets it names, or failing that to the sheets holding a
+    column it names that not every sheet has; None means "search every
+    chunk". ``ranges`` holds the typed column values for range questions and
+    ``chunk_ids`` the stable FAISS id of each chunk.
+    """
+
+    def __init__(self):
+        self.sheets: List[Tuple[str, List[str], int, int]] = []
+        self.n_rows = 0
+        self.ranges = RangeIndex()
+        self.chunk_ids: List[int] = []
+        self._name_toks: List[frozenset] = []
+        self._col_toks: List[List[frozenset]] = []
+
+    def add_sheet(self, name: str, columns: List[str], start: int, end: int) -> None:
+        self.sheets.append((name, list(columns), start, end))
+        self.n_rows = max(self.n_rows, end)
+        self._name_toks.append(frozenset(_tokenize(name)))
+        self._col_toks.append([t for t in (frozenset(_tokenize(c)) for c in columns) if t])
+
+    def match(self, query: str) -> Optional[np.ndarray]:
+        """Chunk ids of the sheets ``query`` refers to, or None for no filter."""
+        if len(self.sheets) < 2:
+            return None
+        q = set(_tokenize(query))
+        if not q:
+            return None
+        hit = [i for i, toks in enumerate(self._name_toks) if toks and toks <= q]
+        if not hit:
+            # Columns every sheet has (e.g. "Month") do not discriminate
+            matched = [{toks for toks in cols if toks <= q} for cols in self._col_toks]
+            common = set.intersection(*matched)
+            hit = [i for i, m in enumerate(matched) if m - common]
+        if not hit or len(hit) == len(self.sheets):
+            return None
+        return np.concatenate([np.arange(self.sheets[i][2], self.sheets[i][3], dtype=np.int64) for i in hit])
+
+
+def _top_indices(scores: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the ``n`` largest scores, best first, without a full sort."""
+    n = min(n, scores.size)
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _minmax(xs: np.ndarray) -> np.ndarray:
+    """Min-max scale to [0, 1]; constant input maps to 0.5."""
+    xs = np.asarray(xs, dtype=np.float64)
+    if xs.size == 0:
+        return xs
+    mn = xs.min()
+    rng = xs.max() - mn
+    if rng < 1e-9:
+        return np.full(xs.shape, 0.5)
+    return (xs - mn) / rng
+
+
+def _rrf(
+    cand_idx: List[int],
+    bm25_idx: List[int],
+    faiss_idx: List[int],
+    weight_bm25: float,
+    weight_embed: float,
+    rrf_k: int,
+) -> np.ndarray:
+    """Weighted reciprocal-rank fusion, scaled so rank 1 in both lists is 1.0."""
+    bm25_rank = {d: r for r, d in enumerate(bm25_idx, start=1)}
+    faiss_rank = {d: r for r, d in enumerate(faiss_idx, start=1)}
+    scores = np.zeros(len(cand_idx), dtype=np.float64)
+    for i, d in enumerate(cand_idx):
+        if d in bm25_rank:
+            scores[i] += weight_bm25 / (rrf_k + bm25_rank[d])
+        if d in faiss_rank:
+            scores[i] += weight_embed / (rrf_k + faiss_rank[d])
+    best = (weight_bm25 + weight_embed) / (rrf_k + 1)
+    return scores / best if best > 0 else scores
 
 
 def _cosine_sim(q: np.ndarray, M: np.ndarray) -> np.ndarray:
@@ -161,8 +633,30 @@ def retrieve_with_fallback(
     answer_threshold: float = 0.15,
     weight_bm25: float = DEFAULT_W_BM25,
     weight_embed: float = DEFAULT_W_EMBED,
+    bm25: Optional[BM25] = None,
+    bm25_mode: str = DEFAULT_BM25_MODE,
+    fusion: str = DEFAULT_FUSION,
+    rrf_k: int = DEFAULT_RRF_K,
+    metadata: Optional[WorkbookMetadata] = None,
+    prefilter: bool = DEFAULT_PREFILTER,
+    range_boost: float = DEFAULT_RANGE_BOOST,
 ) -> Tuple[List[int], List[str], float]:
     """
+    ``bm25`` is the prebuilt lexical index for ``chunks``; when it is missing
+    or was built for a different corpus a throwaway one is built here.
+    With ``metadata`` and ``prefilter``, both BM25 and FAISS only search the
+    sheets the query mentions (see ``WorkbookMetadata.match``). Rows whose
+    typed cells satisfy a numeric/date predicate in the query (see
+    ``RangeIndex``) join the candidate pool and get ``range_boost`` of the
+    fused score.
+    ``bm25_mode`` is "maxscore" (pruned top-k over the postings) or
+    "exhaustive" (score every chunk, then partition).
+    ``fusion`` selects how BM25 and embedding evidence are combined:
+      - "weighted": min-max fused BM25 scores and the cosine similarities
+        returned by FAISS (stored embeddings fill in BM25-only candidates)
+      - "rrf": weighted reciprocal-rank fusion of the two candidate lists
+      - "rerank": recompute cosine similarity for every candidate
+
     Returns:
       - indices of selected chunks
       - selected chunk texts
@@ -171,56 +665,218 @@ def retrieve_with_fallback(
     if not chunks:
         return [], [], 0.0
 
+    # 0) Metadata prefilter: restrict to the sheets the query mentions
+    allowed = _prefilter(query, chunks, metadata) if prefilter else None
+
     # 1) Keyword/BM25 as primary fallback
-    bm25 = BM25(chunks)
-    bm25_scores = bm25.score(query)
+    if bm25 is None or bm25.N != len(chunks):
+        bm25 = BM25(chunks)
     topn = max(k * bm25_top_mult, min(len(chunks), 50))
-    bm25_idx = np.argsort(bm25_scores)[::-1][:topn].tolist()
+    if bm25_mode == "exhaustive":
+        bm25_scores = bm25.score_array(query)
+        if allowed is None:
+            bm25_idx = _top_indices(bm25_scores, topn).tolist()
+        else:
+            bm25_idx = allowed[_top_indices(bm25_scores[allowed], topn)].tolist()
+    else:
+        bm25_idx = bm25.top_k(query, topn, allowed)[0].tolist()
+    range_idx = _range_candidates(query, chunks, bm25, metadata, allowed, topn)
 
     # 2) Embedding-based results (if FAISS index exists and encoders available)
     faiss_idx: List[int] = []
+    faiss_sims: List[float] = []
     if load_index is not None and encode_query is not None and search_index is not None:
         idx = load_index()
+        q_emb = encode_query(query)
         if idx is not None:
-            q_emb = encode_query(query) 
-            faiss_idx = search_index(q_emb, topn)
-        else:
-            q_emb = encode_query(query)
+            faiss_idx, faiss_sims = _valid_hits(*search_index(q_emb, topn, allowed_ids=allowed), len(chunks))
     else:
         q_emb = np.zeros((1, 1), dtype=np.float32)
 
-    # 3) Candidate pool = union of bm25 and faiss candidates
-    cand_idx = list(dict.fromkeys(bm25_idx + faiss_idx))  # preserve order
-
-    # 4) Re-rank with embeddings among candidates; also compute lexical overlap
-    cand_texts = [chunks[i] for i in cand_idx]
-    qset = set(_tokenize(query))
-    jacc_list = []
-    for t in cand_texts:
-        tset = set(_tokenize(t))
-        inter = len(qset & tset)
-        uni = len(qset | tset) or 1
-        jacc_list.append(inter / uni)
-    jacc = np.array(jacc_list, dtype=np.float32)
-
-    if encode_texts is not None and q_emb.shape[1] > 1:
-        cand_embs = encode_texts(cand_texts)
-        q_vec = q_emb[0]
-        sims = _cosine_sim(q_vec, cand_embs)
+    return _fuse_candidates(
+        query, chunks, bm25, bm25_idx, faiss_idx, faiss_sims, q_emb,
+        k, answer_threshold, weight_bm25, weight_embed, fusion, rrf_k,
+        range_idx, range_boost,
+    )
+
+
+def retrieve_many(
+    queries: List[str],
+    chunks: List[str],
+    k: int = 5,
+    bm25_top_mult: int = DEFAULT_BM25_TOP_MULT,
+    answer_threshold: float = 0.15,
+    weight_bm25: float = DEFAULT_W_BM25,
+    weight_embed: float = DEFAULT_W_EMBED,
+    bm25: Optional[BM25] = None,
+    bm25_mode: str = DEFAULT_BM25_MODE,
+    fusion: str = DEFAULT_FUSION,
+    rrf_k: int = DEFAULT_RRF_K,
+    metadata: Optional[WorkbookMetadata] = None,
+    prefilter: bool = DEFAULT_PREFILTER,
+    range_boost: float = DEFAULT_RANGE_BOOST,
+) -> List[Tuple[List[int], List[str], float]]:
+    """Batched ``retrieve_with_fallback`` over the same chunks.
+
+    All queries are encoded in one encoder batch, searched with a single
+    FAISS call over the query matrix and scored with one BM25 sparse matrix
+    product. Queries narrowed by the metadata prefilter get their own
+    filtered FAISS search instead. Returns one (indices, texts, best score) tuple
+    per query.
+    """
+    if not queries:
+        return []
+    if not chunks:
+        return [([], [], 0.0) for _ in queries]
+
+    if bm25 is None or bm25.N != len(chunks):
+        bm25 = BM25(chunks)
+    topn = max(k * bm25_top_mult, min(len(chunks), 50))
+    allowed = [_prefilter(q, chunks, metadata) if prefilter else None for q in queries]
+    bm25_idx = []
+    for row, ids in zip(bm25.score_batch(queries), allowed):
+        top = _top_indices(row, topn) if ids is None else ids[_top_indices(row[ids], topn)]
+        if bm25_mode != "exhaustive":
+            # Match top_k, which only returns chunks sharing a query term
+            top = top[row[top] > 0]
+        bm25_idx.append(top.tolist())
+
+    hits: List[Tuple[List[int], List[float]]] = [([], []) for _ in queries]
+    if load_index is not None and encode_queries is not None and search_index_many is not None:
+        idx = load_index()
+        q_embs = encode_queries(queries)
+        if idx is not None:
+            # Narrowed queries get only their filtered search
+            plain = [j for j, ids in enumerate(allowed) if ids is None]
+            narrowed = [j for j, ids in enumerate(allowed) if ids is not None]
+            if plain:
+                ids, sims = search_index_many(q_embs[plain], topn)
+                for j, i, s in zip(plain, ids, sims):
+                    hits[j] = _valid_hits(i, s, len(chunks))
+            if narrowed and search_index is not None:
+                for j in narrowed:
+                    hits[j] = _valid_hits(*search_index(q_embs[j:j + 1], topn, allowed_ids=allowed[j]), len(chunks))
+            elif narrowed:
+                # No filtered search: keep the allowed rows of an unfiltered one
+                ids, sims = search_index_many(q_embs[narrowed], topn)
+                for j, i, s in zip(narrowed, ids, sims):
+                    i, s = _valid_hits(i, s, len(chunks))
+                    keep = np.isin(np.asarray(i, dtype=np.int64), allowed[j])
+                    hits[j] = np.asarray(i, dtype=np.int64)[keep].tolist(), np.asarray(s, dtype=np.float32)[keep].tolist()
     else:
-        sims = jacc.copy()
+        q_embs = np.zeros((len(queries), 1), dtype=np.float32)
+
+    return [
+        _fuse_candidates(
+            q, chunks, bm25, bm25_idx[j], hits[j][0], hits[j][1], q_embs[j:j + 1],
+            k, answer_threshold, weight_bm25, weight_embed, fusion, rrf_k,
+            _range_candidates(q, chunks, bm25, metadata, allowed[j], topn), range_boost,
+        )
+        for j, q in enumerate(queries)
+    ]
+
+
+def _prefilter(query: str, chunks: List[str], metadata: Optional[WorkbookMetadata]) -> Optional[np.ndarray]:
+    if metadata is None or metadata.n_rows != len(chunks):
+        return None
+    return metadata.match(query)
+
+
+def _range_candidates(
+    query: str,
+    chunks: List[str],
+    bm25: BM25,
+    metadata: Optional[WorkbookMetadata],
+    allowed: Optional[np.ndarray],
+    topn: int,
+) -> List[int]:
+    if metadata is None or metadata.n_rows != len(chunks) or not metadata.ranges:
+        return []
+    ids = metadata.ranges.match(query)
+    if ids is None or ids.size == 0:
+        return []
+    if allowed is not None:
+        ids = np.intersect1d(ids, allowed)
+    if ids.size > topn:
+        # Broad predicates ("after 2001") keep the rows the query text favours
+        ids = ids[_top_indices(bm25.score_docs(query, ids), topn)]
+    return ids.tolist()
+
+
+def _valid_hits(ids: List[int], sims: List[float], n: int) -> Tuple[List[int], List[float]]:
+    # FAISS pads with -1 when it has fewer than k hits
+    hits = [(i, sim) for i, sim in zip(ids, sims) if 0 <= i < n]
+    return [i for i, _ in hits], [sim for _, sim in hits]
+
+
+def _fuse_candidates(
+    query: str,
+    chunks: List[str],
+    bm25: BM25,
+    bm25_idx: List[int],
+    faiss_idx: List[int],
+    faiss_sims: List[float],
+    q_emb: np.ndarray,
+    k: int,
+    answer_threshold: float,
+    weight_bm25: float,
+    weight_embed: float,
+    fusion: str,
+    rrf_k: int,
+    range_idx: Optional[List[int]] = None,
+    range_boost: float = 0.0,
+) -> Tuple[List[int], List[str], float]:
+    # 3) Candidate pool = union of bm25, faiss and range-predicate candidates
+    range_idx = range_idx or []
+    cand_idx = list(dict.fromkeys(bm25_idx + faiss_idx + range_idx))  # preserve order
+    cand = np.asarray(cand_idx, dtype=np.int64)
+
+    # 4) Fuse BM25 and embedding evidence among candidates; also compute lexical overlap
+    jacc = bm25.jaccard(query, cand)
 
-    bm25_norm = _normalize([bm25_scores[i] for i in cand_idx])
-    sim_norm = _normalize(sims.tolist())
+    stored = load_embeddings() if load_embeddings is not None else None
+    if not (
+        isinstance(stored, np.ndarray)
+        and stored.shape[0] == len(chunks)
+        and stored.shape[1] == q_emb.shape[1]
+    ):
+        stored = None
+    q_vec = q_emb[0] / (np.linalg.norm(q_emb[0]) + 1e-9)
+
+    if fusion == "rrf":
+        combined = _rrf(cand_idx, bm25_idx, faiss_idx, weight_bm25, weight_embed, rrf_k)
+    else:
+        if fusion == "weighted" and faiss_idx:
+            # FAISS already scored its hits by cosine similarity; only
+            # BM25-only candidates need a lookup, or one encoder call
+            faiss_map = dict(zip(faiss_idx, faiss_sims))
+            sims = np.array([faiss_map.get(d, np.nan) for d in cand_idx], dtype=np.float64)
+            missing = np.isnan(sims)
+            if missing.any():
+                if stored is not None:
+                    sims[missing] = stored[cand[missing]] @ q_vec
+                elif encode_texts is not None and q_emb.shape[1] > 1:
+                    sims[missing] = _cosine_sim(q_emb[0], encode_texts([chunks[i] for i in cand[missing]]))
+                else:
+                    sims = jacc.copy()
+        elif stored is not None:
+            # Stored rows are already normalized: one gather + mat-vec
+            sims = stored[cand] @ q_vec
+        elif encode_texts is not None and q_emb.shape[1] > 1:
+            sims = _cosine_sim(q_emb[0], encode_texts([chunks[i] for i in cand_idx]))
+        else:
+            sims = jacc.copy()
+        bm25_cand = bm25.score_docs(query, cand)
+        combined = weight_bm25 * _minmax(bm25_cand) + weight_embed * _minmax(sims)
 
-    combined = [weight_bm25 * b + weight_embed * s for b, s in zip(bm25_norm, sim_norm)]
-    if combined and (max(combined) - min(combined) < 1e-6):
-        combined = _normalize(jacc.tolist())
-    order = np.argsort(combined)[::-1]
-    final_idx = [cand_idx[i] for i in order[:k]]
+    if combined.size and (combined.max() - combined.min() < 1e-6):
+        combined = _minmax(jacc)
+    if range_idx and range_boost > 0:
+        combined = (1 - range_boost) * combined + range_boost * np.isin(cand, range_idx)
+    final_idx = cand[_top_indices(combined, k)].tolist()
     final_texts = [chunks[i] for i in final_idx]
 
-    best_score = max(max(combined) if combined else 0.0, float(jacc.max()) if jacc.size else 0.0)
+    best_score = max(float(combined.max()) if combined.size else 0.0, float(jacc.max()) if jacc.size else 0.0)
 
     # 5) Answerability check
     if best_score < answer_threshold:
@@ -1,9 +1,42 @@
+import hashlib
+from bisect import bisect_left
 import json
+import os
+import pickle
 import re
+import shutil
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 import pandas as pd
-from llm_embedding import load_index, build_index
-from retrieval import retrieve_with_fallback
+from llm_embedding import (
+    ENCODER_ID,
+    load_index,
+    build_index,
+    load_embeddings,
+    load_transform,
+    index_state,
+    index_spec_mismatch,
+    load_chunk_ids,
+    load_index_spec,
+    update_index,
+    use_index,
+    workbook_index_path,
+)
+from retrieval import (
+    retrieve_with_fallback,
+    retrieve_many,
+    BM25,
+    WorkbookMetadata,
+    DEFAULT_BM25_MODE,
+    DEFAULT_FUSION,
+    DEFAULT_RANGE_BOOST,
+    DEFAULT_RRF_K,
+    DEFAULT_W_BM25,
+    DEFAULT_W_EMBED,
+)
 from llm_generating import generate_answer
 from table_linearizer import linearize
 from save_jsonl import save_interaction
@@ -21,11 +54,434 @@ K = cfg.get("K", 5)
 ANSWERABILITY_THRESHOLD = cfg.get("ANSWERABILITY_THRESHOLD", 0.15)
 EVIDENCE_OVERLAP_THRESHOLD = cfg.get("EVIDENCE_OVERLAP_THRESHOLD", 0.15)
 D_WORD_LIMIT = int(cfg.get("DETAILED_WORD_LIMIT", 200))
+RETRIEVAL_CACHE_SIZE = int(cfg.get("RETRIEVAL_CACHE", {}).get("MAX_SIZE", 512))
+_wr = cfg.get("WORKBOOK_REGISTRY", {})
+REGISTRY_MEMORY_BUDGET_MB = float(_wr.get("MEMORY_BUDGET_MB", 512))
+REGISTRY_MAX_ON_DISK = int(_wr.get("MAX_ON_DISK", 16))
+# Bump when the layout of the workbook snapshot files changes
+SNAPSHOT_VERSION = 1
+
+
+class RetrievalCache:
+    """Thread-safe LRU cache of retrieval results for the loaded workbook.
+
+    Keys are (workbook fingerprint, normalized prompt, k, retrieval
+    settings); values are the (idxs, selected, best_score) tuples returned
+    by ``retrieve_with_fallback``. ``set_current_chunks`` clears it.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple, tuple[list[int], list[str], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[list[int], list[str], float] | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return list(item[0]), list(item[1]), item[2]
+
+    def put(self, key: tuple, value: tuple[list[int], list[str], float]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (list(value[0]), list(value[1]), value[2])
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_EVIDENCE_STOP = {
+    "the","a","an","is","are","to","of","and","in","on","for","by","with","at","from","as","it","this","that","be","or",
+    "what","which","who","whom","whose","when","where","why","how"
+}
+_EVIDENCE_SYN = {"closing": "close", "closed": "close", "prices": "price"}
+
+def _evidence_token(t: str) -> str:
+    t = t.lower()
+    for suf in ("ing","ed","es","s"):
+        if t.endswith(suf) and len(t) > 4:
+            t = t[: -len(suf)]
+            break
+    return _EVIDENCE_SYN.get(t, t)
+
+def _evidence_tokens(s: str) -> list[str]:
+    raw = [t for t in re.split(r"[^\w]+", (s or "").lower()) if t and len(t) > 2 and t not in _EVIDENCE_STOP]
+    return [_evidence_token(t) for t in raw]
+
+def _chunk_terms(text: str) -> tuple[str, ...]:
+    """Sorted unique evidence terms of a chunk, built once at ingest"""
+    return tuple(sorted(set(_evidence_tokens(text))))
+
+def _has_term(terms: tuple[str, ...], t: str) -> bool:
+    i = bisect_left(terms, t)
+    return i < len(terms) and terms[i] == t
+
+def _term_coverage(q_terms: set[str], terms: tuple[str, ...]) -> float:
+    """Fraction of query terms present in a chunk's sorted term array.
+
+    A term also matches when it and a chunk term of 4+ characters are
+    prefixes of one another. Terms sharing a prefix are contiguous in the
+    sorted array, so each lookup is a binary search instead of a scan.
+    """
+    if not q_terms or not terms:
+        return 0.0
+    matched = 0
+    for qt in q_terms:
+        i = bisect_left(terms, qt)
+        if i < len(terms) and (terms[i] == qt or (len(qt) >= 4 and terms[i].startswith(qt))):
+            matched += 1
+        elif any(_has_term(terms, qt[:n]) for n in range(4, len(qt))):
+            matched += 1
+    return matched / len(q_terms)
+
+
+def _nbytes(arr) -> int:
+    n = getattr(arr, "nbytes", 0)
+    return n if isinstance(n, int) else 0
+
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, path)
+
+
+class WorkbookEntry:
+    """One workbook's chunks and index artifacts, resident or evicted to disk.
+
+    On disk a workbook is a snapshot directory: the FAISS index with its
+    embeddings, transform and chunk ids, ``workbook.pkl`` (chunks and
+    metadata), ``tokens.pkl`` (BM25 and chunk terms) and ``manifest.json``.
+    The manifest is written last and removed before any other file is
+    rewritten, so a snapshot is only used when it was completely written
+    for this file content and this embedding model.
+    """
+
+    def __init__(self, path: str, file_fingerprint: str):
+        self.path = path
+        self.file_fingerprint = file_fingerprint
+        self.key = hashlib.blake2b(f"{path}\x00{file_fingerprint}".encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+        # One on-disk slot per path: a new version of the file replaces the old
+        slot = hashlib.blake2b(path.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+        self.index_path = workbook_index_path(slot)
+        self.fingerprint = ""
+        self.n_chunks = 0
+        self.nbytes = 0
+        self.chunks: list[str] | None = None
+        self.bm25: BM25 | None = None
+        self.metadata: WorkbookMetadata | None = None
+        self.terms: list[tuple[str, ...]] | None = None
+        self.index = None
+        self.embeddings = None
+        self.transform = None
+        self.chunk_ids = None
+
+    @property
+    def resident(self) -> bool:
+        return self.chunks is not None
+
+    @property
+    def state_path(self) -> Path:
+        return Path(self.index_path).parent / "workbook.pkl"
+
+    @property
+    def tokens_path(self) -> Path:
+        return Path(self.index_path).parent / "tokens.pkl"
+
+    @property
+    def manifest_path(self) -> Path:
+        return Path(self.index_path).parent / "manifest.json"
+
+    def save(self) -> None:
+        """Persist chunks, metadata and token cache, then commit them with the manifest."""
+        state = {
+            "path": self.path,
+            "file_fingerprint": self.file_fingerprint,
+            "fingerprint": self.fingerprint,
+            "chunks": self.chunks,
+            "metadata": self.metadata,
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.state_path, lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL))
+        # Optional: without it a reload re-tokenizes the chunks
+        try:
+            _write_atomic(self.tokens_path, lambda f: pickle.dump((self.bm25, self.terms), f, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"Warning: Failed to save token cache to {self.tokens_path}: {e}")
+            self.tokens_path.unlink(missing_ok=True)
+        folder = self.manifest_path.parent
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "path": self.path,
+            "file_fingerprint": self.file_fingerprint,
+            "fingerprint": self.fingerprint,
+            "encoder": ENCODER_ID,
+            "index": load_index_spec(self.index_path),
+            "chunks": len(self.chunks or []),
+            "files": {
+                p.name: p.stat().st_size
+                for p in sorted(folder.iterdir())
+                if p.is_file() and p.name != self.manifest_path.name and not p.name.endswith(".tmp")
+            },
+        }
+        _write_atomic(self.manifest_path, lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+
+    def read_manifest(self) -> dict | None:
+        """The snapshot manifest of this path, or None if it is missing, stale or incomplete.
+
+        Any version of the file is accepted; callers compare ``file_fingerprint``.
+        """
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("version") != SNAPSHOT_VERSION or manifest.get("path") != self.path
+                or manifest.get("encoder") != ENCODER_ID):
+            return None
+        # An index built to other FAISS_INDEX settings is as stale as one from another encoder
+        if index_spec_mismatch(manifest.get("index"), manifest.get("chunks", 0)) is not None:
+            return None
+        folder = self.manifest_path.parent
+        for name, size in manifest.get("files", {}).items():
+            try:
+                if (folder / name).stat().st_size != size:
+                    return None
+            except OSError:
+                return None
+        return manifest
+
+    def discard_snapshot(self) -> None:
+        """Invalidate the on-disk snapshot before its files are rewritten.
+
+        Index files no valid manifest vouches for (an interrupted write,
+        another embedding model or index config, an older layout) are deleted so the next
+        build starts clean instead of updating them in place.
+        """
+        valid = self.read_manifest() is not None
+        self.manifest_path.unlink(missing_ok=True)
+        if not valid:
+            shutil.rmtree(self.manifest_path.parent, ignore_errors=True)
+
+    def load(self) -> bool:
+        """Bring an evicted workbook back from its snapshot; False if there is no usable one."""
+        manifest = self.read_manifest()
+        if manifest is None or manifest.get("file_fingerprint") != self.file_fingerprint:
+            return False
+        # A snapshot pickled by an older build can name classes or modules
+        # that no longer exist; any failure means rebuilding, never a 500
+        try:
+            with open(self.state_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("path") != self.path or state.get("file_fingerprint") != self.file_fingerprint:
+                raise ValueError("snapshot belongs to another file")
+            chunks, metadata, fingerprint = state["chunks"], state["metadata"], state["fingerprint"]
+        except Exception as e:
+            print(f"Warning: Discarding unreadable workbook snapshot {self.state_path}: {e!r}")
+            self.discard_snapshot()
+            return False
+        self.chunks, self.metadata, self.fingerprint = chunks, metadata, fingerprint
+        self.n_chunks = len(self.chunks)
+        try:
+            with open(self.tokens_path, "rb") as f:
+                self.bm25, self.terms = pickle.load(f)
+        except Exception:
+            self.bm25 = self.terms = None
+        if self.terms is None or len(self.terms) != self.n_chunks:
+            self.bm25 = BM25(self.chunks) if self.chunks else None
+            self.terms = [_chunk_terms(c) for c in self.chunks]
+        use_index(self.index_path)
+        self.index, self.embeddings, self.transform = load_index(), load_embeddings(), load_transform()
+        self.chunk_ids = load_chunk_ids()
+        if self.index is not None and self.chunk_ids is None:
+            # Hits of an id-mapped index cannot be mapped back to chunks without them
+            print(f"Warning: Chunk ids missing from workbook snapshot {self.manifest_path.parent}; rebuilding")
+            self.evict()
+            self.discard_snapshot()
+            return False
+        self.nbytes = self._measure()
+        return True
+
+    def evict(self) -> None:
+        self.chunks = self.bm25 = self.metadata = self.terms = None
+        self.index = self.embeddings = self.transform = self.chunk_ids = None
+        self.nbytes = 0
+
+    def _measure(self) -> int:
+        """Approximate resident bytes: chunk text, BM25 matrices, embeddings and the index."""
+        total = sum(len(c) for c in self.chunks or []) + _nbytes(self.embeddings) + _nbytes(self.chunk_ids)
+        if self.bm25 is not None:
+            for m in (self.bm25.tf, self.bm25.weights):
+                total += _nbytes(m.data) + _nbytes(m.indices) + _nbytes(m.indptr)
+        try:
+            total += Path(self.index_path).stat().st_size
+        except (OSError, TypeError):
+            pass
+        return total
+
+
+class WorkbookRegistry:
+    """Workbooks opened in this session, keyed by path + file fingerprint.
+
+    Resident workbooks keep their chunks, BM25, metadata, FAISS index and
+    embeddings in memory; least-recently-used ones beyond the memory budget
+    drop back to their on-disk snapshot (see ``WorkbookEntry``) and reload
+    without re-parsing or re-embedding, as do workbooks opened before a
+    restart. The active workbook is never evicted. Callers hold
+    ``_workbook_lock``.
+    """
+
+    def __init__(self, budget_bytes: int, max_on_disk: int = 16):
+        self.budget_bytes = budget_bytes
+        self.max_on_disk = max_on_disk
+        self.active: WorkbookEntry | None = None
+        self._entries: OrderedDict[str, WorkbookEntry] = OrderedDict()
+
+    def get(self, path: str, file_fingerprint: str) -> WorkbookEntry | None:
+        """A registered workbook for this exact file content, resident or reloaded."""
+        entry = WorkbookEntry(path, file_fingerprint)
+        entry = self._entries.get(entry.key, entry)
+        if not entry.resident and not self._load(entry):
+            return None
+        self._touch(entry)
+        return entry
+
+    def find(self, path: str) -> WorkbookEntry | None:
+        """Most recently used registered version of the workbook at ``path``."""
+        for entry in reversed(self._entries.values()):
+            if entry.path == path:
+                if not entry.resident and not self._load(entry):
+                    return None
+                self._touch(entry)
+                return entry
+        return None
+
+    def _load(self, entry: WorkbookEntry) -> bool:
+        """``entry.load()``; on failure the index location goes back to the active workbook's."""
+        if entry.load():
+            return True
+        active = self.active
+        if active is not None:
+            use_index(active.index_path, active.index, active.embeddings, active.transform, active.chunk_ids)
+        else:
+            use_index(None)
+        return False
+
+    def add(self, entry: WorkbookEntry) -> None:
+        # An edited file supersedes the older registered version, whose
+        # on-disk slot the new one has just overwritten
+        for old in [e for e in self._entries.values() if e.path == entry.path and e.key != entry.key]:
+            self._drop(old, remove_files=False)
+        entry.n_chunks = len(entry.chunks or [])
+        entry.nbytes = entry._measure()
+        try:
+            entry.save()
+        except OSError as e:
+            print(f"Warning: Failed to save workbook state to {entry.state_path}: {e}")
+        self._touch(entry)
+
+    def release(self, path: str) -> None:
+        """Let go of the in-memory (possibly memory-mapped) artifacts of ``path``.
+
+        Called before that path's index files are rewritten; Windows refuses
+        to replace a file that is still mapped.
+        """
+        for e in self._entries.values():
+            if e.path == path and e.resident:
+                e.evict()
+
+    def activate(self, entry: WorkbookEntry) -> None:
+        global _current_chunks, _current_bm25, _current_metadata, _current_fingerprint, _current_terms
+        _current_chunks = entry.chunks or []
+        _current_bm25 = entry.bm25
+        _current_terms = entry.terms or []
+        _current_metadata = entry.metadata
+        _current_fingerprint = entry.fingerprint
+        use_index(entry.index_path, entry.index, entry.embeddings, entry.transform, entry.chunk_ids)
+        self.active = entry
+        self._touch(entry)
+
+    def stats(self) -> dict:
+        return {
+            "memory_budget_bytes": self.budget_bytes,
+            "resident_bytes": sum(e.nbytes for e in self._entries.values()),
+            "active": self.active.path if self.active is not None else None,
+            "workbooks": [
+                {
+                    "path": e.path,
+                    "fingerprint": e.file_fingerprint,
+                    "chunks": e.n_chunks,
+                    "resident": e.resident,
+                    "bytes": e.nbytes,
+                }
+                for e in self._entries.values()
+            ],
+        }
+
+    def _touch(self, entry: WorkbookEntry) -> None:
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        self._evict()
+
+    def _evict(self) -> None:
+        resident = sum(e.nbytes for e in self._entries.values())
+        for e in list(self._entries.values()):
+            if resident <= self.budget_bytes:
+                break
+            if e.resident and e is not self.active and e is not next(reversed(self._entries.values())):
+                resident -= e.nbytes
+                e.evict()
+        while len(self._entries) > self.max_on_disk:
+            oldest = next(iter(self._entries.values()))
+            if oldest is self.active:
+                break
+            self._drop(oldest)
+
+    def _drop(self, entry: WorkbookEntry, remove_files: bool = True) -> None:
+        self._entries.pop(entry.key, None)
+        entry.evict()
+        if remove_files:
+            shutil.rmtree(Path(entry.index_path).parent, ignore_errors=True)
+
 
 _current_chunks: list[str] = []
+_current_bm25: BM25 | None = None
+_current_metadata: WorkbookMetadata | None = None
+_current_fingerprint: str = ""
+_current_terms: list[tuple[str, ...]] = []
+_retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE)
+_registry = WorkbookRegistry(int(REGISTRY_MEMORY_BUDGET_MB * 2**20), REGISTRY_MAX_ON_DISK)
+# Serializes workbook switches against retrieval over the active workbook
+_workbook_lock = threading.RLock()
 
-def load_excel_data(excel_path: str) -> list[str]:
-    """Load Excel data and return chunks"""
+def load_excel_workbook(excel_path: str) -> tuple[list[str], WorkbookMetadata]:
+    """Load Excel data and return chunks with their sheet/column metadata"""
     sheets: dict[str, pd.DataFrame] = pd.read_excel(
         excel_path,
         sheet_name=None,
@@ -33,23 +489,140 @@ def load_excel_data(excel_path: str) -> list[str]:
     )
 
     chunks: list[str] = []
+    rows_at: list[tuple[str, int]] = []
+    metadata = WorkbookMetadata()
     for sheet_name, df in sheets.items():
         rows = linearize(df)
         tagged = [f"[{sheet_name}] {r}" for r in rows]
+        start = len(chunks)
         chunks.extend(tagged)
+        rows_at.extend((str(sheet_name), r) for r in range(len(tagged)))
+        metadata.add_sheet(str(sheet_name), [str(c) for c in df.keys()], start, len(chunks))
+        metadata.ranges.add_sheet(str(sheet_name), df, start)
+    metadata.chunk_ids = stable_chunk_ids(chunks, rows_at)
     
-    return chunks
+    return chunks, metadata
 
-def set_current_chunks(chunks: list[str]) -> None:
-    """Set the current chunks to use for RAG pipeline"""
-    global _current_chunks
+def stable_chunk_ids(chunks: list[str], rows_at: list[tuple[str, int]]) -> list[int]:
+    """FAISS id per chunk: a 63-bit hash of its (sheet, row) and its text.
+
+    An unchanged row keeps its id across re-initializations, so only
+    edited, added or removed rows touch the index.
+    """
+    ids = []
+    for text, (sheet, row) in zip(chunks, rows_at):
+        h = hashlib.blake2b(f"{sheet}\x00{row}\x00{text}".encode("utf-8", "surrogatepass"), digest_size=8)
+        ids.append(int.from_bytes(h.digest(), "little") & (2**63 - 1))
+    return ids
+
+def load_excel_data(excel_path: str) -> list[str]:
+    """Load Excel data and return chunks"""
+    return load_excel_workbook(excel_path)[0]
+
+def workbook_fingerprint(chunks: list[str]) -> str:
+    """Content hash of the linearized workbook"""
+    h = hashlib.blake2b(digest_size=16)
+    for c in chunks:
+        h.update(c.encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+def set_current_chunks(chunks: list[str], metadata: WorkbookMetadata | None = None) -> None:
+    """Set the current chunks to use for RAG pipeline and build their BM25 index"""
+    global _current_chunks, _current_bm25, _current_metadata, _current_fingerprint, _current_terms
     _current_chunks = chunks
+    _current_bm25 = BM25(chunks) if chunks else None
+    _current_terms = [_chunk_terms(c) for c in chunks]
+    _current_metadata = metadata
+    _current_fingerprint = workbook_fingerprint(chunks)
+    _retrieval_cache.clear()
 
 def get_current_chunks() -> list[str]:
     """Get the current chunks"""
     global _current_chunks
     return _current_chunks
 
+def get_current_bm25() -> BM25 | None:
+    """Get the BM25 index built for the current chunks"""
+    return _current_bm25
+
+def get_current_metadata() -> WorkbookMetadata | None:
+    """Get the sheet/column metadata of the current chunks"""
+    return _current_metadata
+
+def file_fingerprint(path: str) -> str:
+    """Content hash of the workbook file, cheap next to parsing it"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def open_workbook(excel_path: str) -> tuple[list[str], bool]:
+    """Make ``excel_path`` the current workbook, reusing a registered copy.
+
+    Returns (chunks, reused). A workbook whose file content is unchanged
+    since it was last opened, in this process or before a restart, is
+    switched to (or reloaded from its snapshot) without re-parsing or
+    re-embedding; otherwise it is parsed and registered, and
+    the index of its previous version is updated for just the rows that
+    changed. Empty workbooks are not registered.
+    """
+    path = str(Path(excel_path).resolve())
+    fp = file_fingerprint(path)
+    with _workbook_lock:
+        entry = _registry.get(path, fp)
+        if entry is not None:
+            _registry.activate(entry)
+            return entry.chunks or [], True
+
+    chunks, metadata = load_excel_workbook(excel_path)
+    if not chunks:
+        return [], False
+    with _workbook_lock:
+        entry = WorkbookEntry(path, fp)
+        # The previous version of this path shares the on-disk slot
+        _registry.release(path)
+        use_index(entry.index_path)
+        entry.discard_snapshot()
+        update_index(chunks, getattr(metadata, "chunk_ids", None) or None)
+        set_current_chunks(chunks, metadata)
+        entry.chunks, entry.bm25, entry.metadata, entry.terms = chunks, _current_bm25, metadata, _current_terms
+        entry.fingerprint = _current_fingerprint
+        entry.index, entry.embeddings, entry.transform, entry.chunk_ids = index_state()
+        _registry.add(entry)
+        _registry.activate(entry)
+    return chunks, False
+
+def use_workbook(excel_path: str) -> bool:
+    """Switch to an already opened workbook; False if it was never initialized"""
+    with _workbook_lock:
+        entry = _registry.find(str(Path(excel_path).resolve()))
+        if entry is None:
+            return False
+        if entry is not _registry.active:
+            _registry.activate(entry)
+        return True
+
+def workbook_registry_stats() -> dict:
+    with _workbook_lock:
+        return _registry.stats()
+
+def get_current_fingerprint() -> str:
+    """Get the content fingerprint of the current chunks"""
+    return _current_fingerprint
+
+def retrieval_cache_stats() -> dict:
+    return _retrieval_cache.stats()
+
+def _retrieval_key(prompt: str, k: int) -> tuple:
+    norm = " ".join(unicodedata.normalize("NFKC", prompt or "").split()).casefold()
+    settings = (
+        DEFAULT_W_BM25, DEFAULT_W_EMBED, DEFAULT_FUSION, DEFAULT_RRF_K,
+        DEFAULT_BM25_MODE, DEFAULT_RANGE_BOOST, ANSWERABILITY_THRESHOLD,
+    )
+    return (_current_fingerprint, norm, k, settings)
+
 if __name__ == "__main__":
     if EXCEL_FILE and (ROOT / EXCEL_FILE).exists():
         chunks = load_excel_data(str(ROOT / EXCEL_FILE))
@@ -61,6 +634,72 @@ if __name__ == "__main__":
     exit(0)
 
 
+def retrieve_batch(
+    prompts: list[str], k: int | None = None, workbook: str | None = None
+) -> list[tuple[list[int], list[str], float]]:
+    """Retrieve evidence for many prompts against the current (or given) workbook in one batch.
+
+    ``workbook`` scopes this batch only: the current workbook, which /chat
+    answers from, stays current. Returns None if ``workbook`` was never
+    initialized.
+    """
+    with _workbook_lock, _scoped_workbook(workbook) as found:
+        return _retrieve_batch(prompts, k) if found else None
+
+@contextmanager
+def _scoped_workbook(workbook: str | None):
+    """Make ``workbook`` current for the block, then restore the previous one.
+
+    Yields False if ``workbook`` was never initialized; None keeps the
+    current workbook. Callers hold ``_workbook_lock``.
+    """
+    global _current_chunks, _current_bm25, _current_terms, _current_metadata, _current_fingerprint
+    if workbook is None:
+        yield True
+        return
+    previous = _registry.active
+    saved = (_current_chunks, _current_bm25, _current_terms, _current_metadata, _current_fingerprint)
+    entry = _registry.find(str(Path(workbook).resolve()))
+    if entry is None:
+        yield False
+        return
+    if entry is previous:
+        yield True
+        return
+    _registry.activate(entry)
+    try:
+        yield True
+    finally:
+        if previous is not None:
+            _registry.activate(previous)
+        else:
+            _current_chunks, _current_bm25, _current_terms, _current_metadata, _current_fingerprint = saved
+            _registry.active = None
+            use_index(None)
+
+def _retrieve_batch(prompts: list[str], k: int | None) -> list[tuple[list[int], list[str], float]]:
+    chunks = get_current_chunks()
+    if not chunks:
+        return [([], [], 0.0) for _ in prompts]
+    k = k or K
+    keys = [_retrieval_key(p, k) for p in prompts]
+    results = [_retrieval_cache.get(key) for key in keys]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if todo:
+        fresh = retrieve_many(
+            [prompts[i] for i in todo],
+            chunks,
+            k=k,
+            answer_threshold=ANSWERABILITY_THRESHOLD,
+            bm25=get_current_bm25(),
+            metadata=get_current_metadata(),
+        )
+        for i, r in zip(todo, fresh):
+            _retrieval_cache.put(keys[i], r)
+            results[i] = r
+    return results
+
+
 def _detect_intent(prompt: str) -> str:
     """Heuristic intent detection to tailor the detailed prompt.
     Returns one of: trend, compare, calc, superlative, lookup, explain, summary
@@ -171,59 +810,46 @@ def _build_prompt(selected: list[str], prompt: str, detailed: bool) -> str:
     return "\n".join(base) + tail
 
 
-def rag_pipeline(prompt: str, detailed: bool = False, k: int | None = None) -> tuple[list[str], str]:
+def rag_pipeline(
+    prompt: str, detailed: bool = False, k: int | None = None, workbook: str | None = None
+) -> tuple[list[str], str]:
     k = k or K
 
-    chunks = get_current_chunks()
-    if not chunks:
-        return [], "No workbook data available. Please re-open and initialize the Excel file."
-    
-    _ = load_index() 
-    idxs, selected, best_score = retrieve_with_fallback(
-        prompt,
-        chunks,
-        k=k,
-        answer_threshold=ANSWERABILITY_THRESHOLD,
-    )
+    # ``workbook`` answers this prompt only; the current workbook stays current
+    with _workbook_lock, _scoped_workbook(workbook) as found:
+        chunks = get_current_chunks() if found else []
+        if not chunks:
+            return [], "No workbook data available. Please re-open and initialize the Excel file."
+
+        key = _retrieval_key(prompt, k)
+        cached = _retrieval_cache.get(key)
+        if cached is not None:
+            idxs, selected, best_score = cached
+        else:
+            _ = load_index()
+            idxs, selected, best_score = retrieve_with_fallback(
+                prompt,
+                chunks,
+                k=k,
+                answer_threshold=ANSWERABILITY_THRESHOLD,
+                bm25=get_current_bm25(),
+                metadata=get_current_metadata(),
+            )
+            _retrieval_cache.put(key, (idxs, selected, best_score))
+
+        terms = _current_terms if _current_chunks is chunks else []
 
     if not selected:
         return [], "Insufficient evidence. Please provide more context or initialize data first."
-        
-    STOP = {
-        "the","a","an","is","are","to","of","and","in","on","for","by","with","at","from","as","it","this","that","be","or",
-        "what","which","who","whom","whose","when","where","why","how"
-    }
-    def _norm_tok(t: str) -> str:
-        t = t.lower()
-        for suf in ("ing","ed","es","s"):
-            if t.endswith(suf) and len(t) > 4:
-                t = t[: -len(suf)]
-                break
-        syn = {"closing":"close","closed":"close","prices":"price"}
-        return syn.get(t, t)
-
-    def _tokens(s: str) -> list[str]:
-        raw = [t for t in re.split(r"[^\w]+", (s or "").lower()) if t and len(t) > 2 and t not in STOP]
-        return [_norm_tok(t) for t in raw]
-
-    q_list = _tokens(prompt)
-    qset = set(q_list)
-    max_coverage = 0.0
-    for s in selected:
-        ts = _tokens(s)
-        tset = set(ts)
-        if not qset or not tset:
-            continue
-        matched = 0
-        for qt in qset:
-            if qt in tset:
-                matched += 1
-                continue
-            if any((qt.startswith(tt) or tt.startswith(qt)) and len(qt) >= 4 and len(tt) >= 4 for tt in tset):
-                matched += 1
-        cov = matched / max(1, len(qset))
-        if cov > max_coverage:
-            max_coverage = cov
+
+    q_terms = set(_evidence_tokens(prompt))
+    max_coverage = max(
+        (
+            _term_coverage(q_terms, terms[i] if 0 <= i < len(terms) and chunks[i] == s else _chunk_terms(s))
+            for i, s in zip(idxs, selected)
+        ),
+        default=0.0,
+    )
 
     if max_coverage < EVIDENCE_OVERLAP_THRESHOLD:
         return [], "Insufficient evidence. Please provide more context or initialize data first."
@@ -92,29 +92,76 @@ class TestLLMEmbedding:
 
     @patch('backend.app.src.llm_embedding.faiss')
     @patch('backend.app.src.llm_embedding._encoder')
-    def test_build_index(self, mock_encoder, mock_faiss):
-        """Test index building."""
+    def test_build_index(self, mock_encoder, mock_faiss, tmp_path):
+        """Test index building encodes and adds the chunks batch by batch."""
+        import backend.app.src.llm_embedding as emb_mod
+
+        mock_encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array(
+            [[float(t[-1]), 1.0, 0.0] for t in texts], dtype=np.float32)
+        mock_index = mock_faiss.IndexIDMap2.return_value
+        mock_index.is_trained = True
+        mock_faiss.write_index.side_effect = lambda idx, path: Path(path).write_bytes(b"index")
+
+        with patch.object(emb_mod, '_resolved_index_path', return_value=tmp_path / "index.pkl"), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'flat'), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0), \
+             patch.object(emb_mod, 'INDEX_MMAP', False), \
+             patch.object(emb_mod, 'BUILD_BATCH_SIZE', 2):
+            try:
+                result = emb_mod.build_index(["text1", "text2", "text3"])
+
+                assert result is None
+                assert [c.args[0] for c in mock_encoder.encode.call_args_list] == [["text1", "text2"], ["text3"]]
+                assert [c.args[1].tolist() for c in mock_index.add_with_ids.call_args_list] == [[0, 1], [2]]
+                assert (tmp_path / "index.pkl").read_bytes() == b"index"
+                embs = np.load(tmp_path / "index_embeddings.npy")
+                np.testing.assert_allclose(embs[:, 0] / embs[:, 1], [1, 2, 3], rtol=1e-5)
+            finally:
+                emb_mod.use_index(None)
+
+    def test_index_description(self):
+        """Test the index factory choice per type and row count."""
         with patch.dict('sys.modules', {
             'sentence_transformers': MagicMock(),
             'faiss': MagicMock()
         }):
-            mock_encoder.encode.return_value = np.array([[1, 2, 3], [4, 5, 6]])
-            
-            mock_index = Mock()
-            mock_faiss.IndexFlatL2.return_value = mock_index
+            import backend.app.src.llm_embedding as emb_mod
             
-            with patch('backend.app.src.llm_embedding._resolved_index_path') as mock_path:
-                mock_path.return_value = Mock()
-                mock_path.return_value.parent.mkdir = Mock()
-                
-                from backend.app.src.llm_embedding import build_index
-                
-                texts = ["text1", "text2"]
-                result = build_index(texts)
-                
-                assert result is None
-                mock_encoder.encode.assert_called_once_with(texts, convert_to_numpy=True)
-                mock_index.add.assert_called_once()
+            with patch.object(emb_mod, 'AUTO_FLAT_MAX_ROWS', 1000), \
+                 patch.object(emb_mod, 'AUTO_HNSW_MAX_ROWS', 100000), \
+                 patch.object(emb_mod, 'IVF_NLIST', 0), \
+                 patch.object(emb_mod, 'PQ_M', 48), \
+                 patch.object(emb_mod, 'PQ_NBITS', 8), \
+                 patch.object(emb_mod, 'HNSW_M', 32):
+                assert emb_mod._index_description(500, 384, "auto") == "Flat"
+                assert emb_mod._index_description(5000, 384, "auto") == "HNSW32"
+                assert emb_mod._index_description(400000, 384, "auto").endswith(",PQ48x8")
+                assert emb_mod._index_description(40000, 384, "ivf_flat") == "IVF800,Flat"
+                # Too few rows to train PQ codebooks or any centroid
+                assert emb_mod._index_description(2000, 384, "ivf_pq") == "IVF51,Flat"
+                assert emb_mod._index_description(10, 384, "ivf_flat") == "Flat"
+
+    def test_index_description_storage(self):
+        """Test compact storage modes pick quantized vector encodings."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            import backend.app.src.llm_embedding as emb_mod
+
+            with patch.object(emb_mod, 'IVF_NLIST', 0), \
+                 patch.object(emb_mod, 'PQ_M', 48), \
+                 patch.object(emb_mod, 'PQ_NBITS', 8), \
+                 patch.object(emb_mod, 'HNSW_M', 32):
+                assert emb_mod._index_description(500, 384, "flat", "float32") == "Flat"
+                assert emb_mod._index_description(500, 384, "flat", "float16") == "SQfp16"
+                assert emb_mod._index_description(500, 384, "hnsw", "sq8") == "HNSW32,SQ8"
+                assert emb_mod._index_description(40000, 384, "ivf_flat", "sq8") == "IVF800,SQ8"
+                assert emb_mod._index_description(40000, 384, "flat", "pq") == "PQ48x8"
+                # Too few rows for PQ codebooks: int8 scalar quantization instead
+                assert emb_mod._index_description(500, 384, "flat", "pq") == "SQ8"
 
     @patch('backend.app.src.llm_embedding.faiss')
     @patch('backend.app.src.llm_embedding._resolved_index_path')
@@ -135,7 +182,8 @@ class TestLLMEmbedding:
             result = load_index()
             
             assert result == mock_index
-            mock_faiss.read_index.assert_called_once_with(str(mock_path_obj))
+            # Memory-mapped by default
+            mock_faiss.read_index.assert_called_once_with(str(mock_path_obj), mock_faiss.IO_FLAG_MMAP_IFC)
 
     @patch('backend.app.src.llm_embedding.faiss')
     @patch('backend.app.src.llm_embedding._resolved_index_path')
@@ -177,6 +225,421 @@ class TestLLMEmbedding:
                 
                 assert result is None
 
+    def test_load_embeddings_success(self):
+        """Test loading the persisted chunk embedding matrix."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            import backend.app.src.llm_embedding as emb_mod
+            
+            mock_path_obj = Mock()
+            mock_path_obj.exists.return_value = True
+            embs = np.eye(2, dtype=np.float32)
+            with patch.object(emb_mod, '_embeddings', None), \
+                 patch.object(emb_mod, '_resolved_embeddings_path', return_value=mock_path_obj), \
+                 patch.object(emb_mod.np, 'load', return_value=embs) as mock_np_load:
+                result = emb_mod.load_embeddings()
+                
+                np.testing.assert_array_equal(result, embs)
+                mock_np_load.assert_called_once_with(str(mock_path_obj), mmap_mode="r")
+
+    def test_l2_normalize(self):
+        """Test stored embeddings are unit length."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            from backend.app.src.llm_embedding import _l2_normalize
+            
+            result = _l2_normalize(np.array([[3.0, 4.0], [0.0, 2.0]]))
+            
+            assert result.dtype == np.float32
+            np.testing.assert_allclose(np.linalg.norm(result, axis=1), [1.0, 1.0], rtol=1e-5)
+
+    def test_project_applies_transform(self):
+        """Test query vectors are reduced and re-normalized by the fitted transform."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            import backend.app.src.llm_embedding as emb_mod
+
+            transform = Mock()
+            transform.apply.side_effect = lambda x: x[:, :2] * 3.0
+            embs = np.array([[1.0, 2.0, 2.0], [0.0, 3.0, 4.0]], dtype=np.float32)
+
+            with patch.object(emb_mod, 'load_transform', return_value=transform):
+                result = emb_mod._project(embs)
+            assert result.shape == (2, 2)
+            np.testing.assert_allclose(np.linalg.norm(result, axis=1), [1.0, 1.0], rtol=1e-5)
+
+            with patch.object(emb_mod, 'load_transform', return_value=None):
+                assert emb_mod._project(embs) is embs
+
+    def test_update_index_encodes_only_changed_rows(self, tmp_path):
+        """Test re-initializing re-encodes new rows and removes deleted ids in place."""
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        def vec(text):
+            v = np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8)
+            return v / np.linalg.norm(v)
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array([vec(t) for t in texts], dtype=np.float32)
+
+        with patch.object(emb_mod, 'faiss', real_faiss), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'flat'), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0), \
+             patch.object(emb_mod, 'INCREMENTAL_MAX_CHANGE', 0.9):
+            emb_mod.use_index(tmp_path / "index.pkl")
+            try:
+                first = emb_mod.update_index(["a", "b", "c", "d"], [1, 2, 3, 4])
+                assert first["mode"] == "rebuild"
+
+                emb_mod.use_index(tmp_path / "index.pkl")
+                stats = emb_mod.update_index(["a", "b2", "d", "e"], [1, 5, 4, 6])
+                assert stats == {"mode": "incremental", "encoded": 2, "removed": 2}
+                assert encoder.encode.call_args[0][0] == ["b2", "e"]
+                assert emb_mod.load_index().ntotal == 4
+
+                # Hits come back as chunk positions, not FAISS ids
+                ids, _ = emb_mod.search_index(np.array([vec("e")], dtype=np.float32), 1)
+                assert ids == [3]
+                ids, _ = emb_mod.search_index(np.array([vec("e")], dtype=np.float32), 1, allowed_ids=np.array([0, 2]))
+                assert ids[0] in (0, 2)
+                np.testing.assert_allclose(emb_mod.load_embeddings()[2], vec("d"), rtol=1e-5)
+
+                # A restart maps the files instead of reading them
+                emb_mod.use_index(tmp_path / "index.pkl")
+                with patch.object(emb_mod, 'INDEX_MMAP', True):
+                    assert isinstance(emb_mod.load_embeddings(), np.memmap)
+                    ids, _ = emb_mod.search_index(np.array([vec("e")], dtype=np.float32), 1)
+                assert ids == [3]
+            finally:
+                emb_mod.use_index(None)
+
+    def test_update_index_rebuilds_when_index_config_changes(self, tmp_path):
+        """Test an index built to other FAISS_INDEX settings is rebuilt, not patched."""
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array(
+            [np.random.default_rng(abs(hash(t)) % 2**32).normal(size=8) for t in texts], dtype=np.float32)
+
+        with patch.object(emb_mod, 'faiss', real_faiss), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'auto'), \
+             patch.object(emb_mod, 'AUTO_FLAT_MAX_ROWS', 4), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0), \
+             patch.object(emb_mod, 'INCREMENTAL_MAX_CHANGE', 0.9):
+            emb_mod.use_index(tmp_path / "index.pkl")
+            try:
+                emb_mod.update_index(["a", "b", "c"], [1, 2, 3])
+                assert emb_mod.load_index_spec()["factory"] == "Flat"
+                assert emb_mod.update_index(["a", "b", "c", "d"], [1, 2, 3, 4])["mode"] == "incremental"
+
+                # ``auto`` switches to HNSW past AUTO_FLAT_MAX_ROWS
+                stats = emb_mod.update_index(["a", "b", "c", "d", "e"], [1, 2, 3, 4, 5])
+                assert (stats["mode"], stats["reason"]) == ("rebuild", "index config changed")
+                assert isinstance(emb_mod._base_index(emb_mod.load_index()), real_faiss.IndexHNSW)
+
+                with patch.object(emb_mod, 'STORAGE', 'float16'):
+                    stats = emb_mod.update_index(["a", "b", "c", "d", "e"], [1, 2, 3, 4, 5])
+                    assert (stats["mode"], stats["reason"]) == ("rebuild", "index config changed")
+
+                # An index without a recorded spec is not trusted either
+                (tmp_path / "index_spec.json").unlink()
+                stats = emb_mod.update_index(["a", "b", "c", "d", "e"], [1, 2, 3, 4, 5])
+                assert (stats["mode"], stats["reason"]) == ("rebuild", "index spec unknown")
+            finally:
+                emb_mod.use_index(None)
+
+    def test_search_without_chunk_ids_falls_back_and_rebuilds(self, tmp_path, capsys):
+        """Test an id-mapped index whose ids file is lost still finds chunks, warns, and is rebuilt."""
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        def vec(text):
+            v = np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8)
+            return v / np.linalg.norm(v)
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array([vec(t) for t in texts], dtype=np.float32)
+
+        with patch.object(emb_mod, 'faiss', real_faiss), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'flat'), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0):
+            emb_mod.use_index(tmp_path / "index.pkl")
+            try:
+                emb_mod.update_index(["a", "b", "c", "d"], [11, 12, 13, 14])
+                (tmp_path / "index_ids.npy").unlink()
+                emb_mod.use_index(tmp_path / "index.pkl")
+                capsys.readouterr()
+
+                q = np.array([vec("c")], dtype=np.float32)
+                ids, sims = emb_mod.search_index(q, 2)
+                assert ids[0] == 2 and sims[0] == pytest.approx(1.0, abs=1e-5)
+                ids, _ = emb_mod.search_index(q, 2, allowed_ids=np.array([0, 3]))
+                assert sorted(ids) == [0, 3]
+                assert capsys.readouterr().out.count("Warning: Chunk ids") == 1
+
+                stats = emb_mod.update_index(["a", "b", "c", "d"], [11, 12, 13, 14])
+                assert (stats["mode"], stats["reason"]) == ("rebuild", "chunk ids missing")
+                assert emb_mod.search_index(q, 1)[0] == [2]
+            finally:
+                emb_mod.use_index(None)
+
+    def test_update_index_unmaps_files_before_replacing_them(self, tmp_path):
+        """Test no memory map of a file is alive when it is replaced (Windows forbids it)."""
+        import weakref
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array(
+            [np.random.default_rng(abs(hash(t)) % 2**32).normal(size=8) for t in texts], dtype=np.float32)
+        maps = []
+        real_load, real_replace = np.load, os.replace
+
+        def tracking_load(*args, **kwargs):
+            arr = real_load(*args, **kwargs)
+            if isinstance(arr, np.memmap):
+                maps.append(weakref.ref(arr))
+            return arr
+
+        def checked_replace(src, dst):
+            for ref in maps:
+                arr = ref()
+                assert arr is None or Path(arr.filename).resolve() != Path(dst).resolve(), f"{dst} is still mapped"
+            real_replace(src, dst)
+
+        with patch.object(emb_mod, 'faiss', real_faiss), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'flat'), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0), \
+             patch.object(emb_mod, 'INDEX_MMAP', True), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod.np, 'load', tracking_load), \
+             patch.object(emb_mod.os, 'replace', checked_replace):
+            try:
+                emb_mod.use_index(tmp_path / "index.pkl")
+                emb_mod.update_index(["a", "b", "c", "d"], [1, 2, 3, 4])
+                for chunks, ids, max_change, mode in ((["a", "b", "c", "e"], [1, 2, 3, 5], 0.9, "incremental"),
+                                                      (["f", "g", "h", "i"], [6, 7, 8, 9], 0.5, "rebuild")):
+                    emb_mod.use_index(tmp_path / "index.pkl")
+                    assert isinstance(emb_mod.load_embeddings(), np.memmap)
+                    with patch.object(emb_mod, 'INCREMENTAL_MAX_CHANGE', max_change):
+                        assert emb_mod.update_index(chunks, ids)["mode"] == mode
+                assert maps
+            finally:
+                emb_mod.use_index(None)
+
+    def test_build_index_streams_batches_with_progress(self, tmp_path):
+        """Test the build encodes fixed-size batches and reports rows done."""
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array(
+            [[float(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+        chunks = [str(i) for i in range(5)]
+
+        with patch.object(emb_mod, 'faiss', real_faiss), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod, 'INDEX_TYPE', 'flat'), \
+             patch.object(emb_mod, 'STORAGE', 'float32'), \
+             patch.object(emb_mod, 'PCA_DIM', 0), \
+             patch.object(emb_mod, 'BUILD_BATCH_SIZE', 2):
+            emb_mod.use_index(tmp_path / "index.pkl")
+            try:
+                emb_mod.build_index(chunks)
+                assert [len(c[0][0]) for c in encoder.encode.call_args_list] == [2, 2, 1]
+                progress = emb_mod.build_progress()
+                assert (progress["state"], progress["rows_done"], progress["rows_total"]) == ("done", 5, 5)
+                assert emb_mod.load_index().ntotal == 5
+                np.testing.assert_allclose(emb_mod.load_embeddings()[:, 0] / emb_mod.load_embeddings()[:, 1], range(5), rtol=1e-5)
+            finally:
+                emb_mod.use_index(None)
+
+    def test_load_index_notices_replaced_file(self, tmp_path):
+        """Test an index file rebuilt behind the module's back is reloaded with its sidecars."""
+        real_faiss = pytest.importorskip("faiss")
+        import backend.app.src.llm_embedding as emb_mod
+
+        def write(path, n):
+            idx = real_faiss.IndexIDMap2(real_faiss.IndexFlatIP(4))
+            idx.add_with_ids(np.eye(4, dtype=np.float32)[:n], np.arange(n, dtype=np.int64))
+            real_faiss.write_index(idx, str(path))
+
+        path = tmp_path / "index.pkl"
+        write(path, 2)
+        with patch.object(emb_mod, 'faiss', real_faiss):
+            emb_mod.use_index(path)
+            try:
+                assert emb_mod.load_index().ntotal == 2
+                emb_mod._embeddings = np.zeros((2, 4), dtype=np.float32)
+                write(tmp_path / "other.pkl", 3)
+                os.replace(tmp_path / "other.pkl", path)
+
+                assert emb_mod.load_index().ntotal == 3
+                assert emb_mod._embeddings is None
+            finally:
+                emb_mod.use_index(None)
+
+    def test_encode_batches_through_pool_keeps_order(self):
+        """Test pooled batches come back in submission order with progress counted."""
+        from concurrent.futures import ThreadPoolExecutor
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, convert_to_numpy=True: np.array(
+            [[float(t), 1.0] for t in texts], dtype=np.float32)
+        chunks = [str(i) for i in range(7)]
+        batches = [np.arange(i, min(i + 2, 7)) for i in range(0, 7, 2)]
+
+        with ThreadPoolExecutor(2) as pool, \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'embedding_store', return_value=None), \
+             patch.object(emb_mod, '_pool_workers', 2), \
+             patch.object(emb_mod, '_progress', emb_mod.BuildProgress()):
+            emb_mod._progress.start(7)
+            out = list(emb_mod._encode_batches(chunks, batches, pool))
+            assert emb_mod.build_progress()["rows_done"] == 7
+
+        assert [r.tolist() for r, _ in out] == [b.tolist() for b in batches]
+        embs = np.vstack([e for _, e in out])
+        np.testing.assert_allclose(embs[:, 0] / embs[:, 1], range(7), rtol=1e-5)
+
+    def test_pool_task_survives_pickling(self):
+        """Test the worker function and its arguments cross a spawn boundary intact."""
+        import pickle
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, batch_size=None, convert_to_numpy=True: np.array(
+            [[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+        texts = ["a", "bbb", "cc"]
+
+        # What ProcessPoolExecutor pickles for a spawned worker
+        init, initargs = pickle.loads(pickle.dumps((emb_mod._pool_init, (2,))))
+        fn, args = pickle.loads(pickle.dumps((emb_mod._pool_encode, (texts, False))))
+        assert init is emb_mod._pool_init and initargs == (2,)
+        assert fn is emb_mod._pool_encode
+
+        with patch.object(emb_mod, '_encoder', encoder):
+            out = pickle.loads(pickle.dumps(fn(*args)))
+        np.testing.assert_allclose(out[:, 0] / out[:, 1], [1, 3, 2], rtol=1e-5)
+
+    def test_benchmark_encoding_report(self, capsys):
+        """Test the benchmark reports one row per worker count, also from the command line."""
+        import json
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.encode.side_effect = lambda texts, batch_size=None, convert_to_numpy=True: np.ones(
+            (len(texts), 2), dtype=np.float32)
+
+        with patch.object(emb_mod, '_encoder', encoder):
+            report = emb_mod.benchmark_encoding(["x"] * 5, worker_counts=(1,), batch_size=2)
+            assert len(report) == 1
+            assert set(report[0]) == {"workers", "rows", "seconds", "rows_per_sec"}
+            assert (report[0]["workers"], report[0]["rows"]) == (1, 5)
+            assert report[0]["rows_per_sec"] > 0
+
+            assert emb_mod.main(["benchmark", "--workers", "1", "--rows", "7"]) == 0
+            printed = json.loads(capsys.readouterr().out)
+            assert [(r["workers"], r["rows"]) for r in printed] == [(1, 7)]
+
+            with pytest.raises(SystemExit):
+                emb_mod.main(["benchmark", "--workers", "two"])
+
+    def test_encode_bucketed_sorts_by_length_and_restores_order(self):
+        """Test texts are batched shortest first within the token budget, returned in input order."""
+        import backend.app.src.llm_embedding as emb_mod
+
+        encoder = Mock()
+        encoder.token_lengths.side_effect = lambda texts: [len(t.split()) for t in texts]
+        encoder.encode.side_effect = lambda texts, batch_size=None, convert_to_numpy=True: np.array(
+            [[float(len(t.split())), 1.0] for t in texts], dtype=np.float32)
+        texts = ["w " * n for n in (9, 1, 5, 2, 9, 1)]
+
+        with patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'TOKEN_BUDGET', 10), \
+             patch.object(emb_mod, 'MAX_SEQ_LENGTH', 8):
+            out = emb_mod._encode_bucketed(texts)
+
+        batches = [[len(t.split()) for t in c.args[0]] for c in encoder.encode.call_args_list]
+        # Lengths are capped at 8, so the two 9-word texts cannot share a batch
+        assert batches == [[1, 1, 2], [5], [9], [9]]
+        assert encoder.encode.call_args_list[0].kwargs["batch_size"] == 3
+        np.testing.assert_array_equal(out[:, 0], [9, 1, 5, 2, 9, 1])
+
+    def test_embedding_store_roundtrip_and_eviction(self, tmp_path):
+        """Test the disk store serves stored vectors and evicts least recently used."""
+        import backend.app.src.llm_embedding as emb_mod
+
+        store = emb_mod.EmbeddingStore(tmp_path / "cache.sqlite", 3 * 16, "model-a")
+        keys = [store.key(t) for t in ("a", "b", "c")]
+        store.put_many(keys, np.arange(12, dtype=np.float32).reshape(3, 4))
+        assert store.key("a") != emb_mod.EmbeddingStore(tmp_path / "other.sqlite", 64, "model-b").key("a")
+
+        rows = store.get_many([keys[2], store.key("missing")])
+        np.testing.assert_array_equal(rows[0], [8, 9, 10, 11])
+        assert rows[1] is None
+
+        # Over the cap: "a" and "b" are the least recently used
+        store.put_many([store.key("d")], np.ones((1, 4), dtype=np.float32))
+        reopened = emb_mod.EmbeddingStore(tmp_path / "cache.sqlite", 3 * 16, "model-a")
+        found = [r is not None for r in reopened.get_many([store.key(t) for t in ("a", "b", "c", "d")])]
+        assert found == [False, False, True, True]
+        assert store.stats()["evicted"] == 2
+
+    def test_encoder_fingerprint_covers_sequence_limit(self, tmp_path):
+        """Test vectors stored under another truncation limit are not served."""
+        import backend.app.src.llm_embedding as emb_mod
+
+        (tmp_path / "model").mkdir()
+        (tmp_path / "model" / "model.safetensors").write_bytes(b"weights")
+
+        with patch.object(emb_mod, 'ROOT', tmp_path), \
+             patch.object(emb_mod, 'EMBEDDING_MODEL', 'model'), \
+             patch.object(emb_mod, 'EMBEDDING_BACKEND', 'torch'):
+            with patch.object(emb_mod, 'MAX_SEQ_LENGTH', 256):
+                long_limit = emb_mod._encoder_fingerprint()
+                assert emb_mod._encoder_fingerprint() == long_limit
+            with patch.object(emb_mod, 'MAX_SEQ_LENGTH', 128):
+                assert emb_mod._encoder_fingerprint() != long_limit
+
+    def test_encode_texts_uses_embedding_store(self, tmp_path):
+        """Test only texts missing from the disk store reach the encoder."""
+        import backend.app.src.llm_embedding as emb_mod
+
+        store = emb_mod.EmbeddingStore(tmp_path / "cache.sqlite", 2**20, "model")
+        store.put_many([store.key("seen")], np.array([[1.0, 0.0]], dtype=np.float32))
+        encoder = Mock()
+        encoder.encode.return_value = np.array([[0.0, 2.0]], dtype=np.float32)
+
+        with patch.object(emb_mod, 'embedding_store', return_value=store), \
+             patch.object(emb_mod, '_encoder', encoder), \
+             patch.object(emb_mod, 'load_transform', return_value=None):
+            result = emb_mod.encode_texts(["seen", "new", "new"])
+
+        encoder.encode.assert_called_once_with(["new"], convert_to_numpy=True)
+        np.testing.assert_array_equal(result, [[1.0, 0.0], [0.0, 2.0], [0.0, 2.0]])
+        assert store.get_many([store.key("new")])[0] is not None
+
     @patch('backend.app.src.llm_embedding._encoder')
     def test_encode_query(self, mock_encoder):
         """Test query encoding."""
@@ -194,6 +657,68 @@ class TestLLMEmbedding:
             np.testing.assert_array_equal(result, np.array([[1, 2, 3]]))
             mock_encoder.encode.assert_called_once_with(["test query"], convert_to_numpy=True)
 
+    def test_encode_query_cache_hit(self):
+        """Test repeated queries are served from the LRU cache."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            import backend.app.src.llm_embedding as emb_mod
+            
+            cache = emb_mod.QueryEmbeddingCache(max_size=4, ttl=60)
+            mock_encoder = Mock()
+            mock_encoder.encode.return_value = np.array([[1.0, 2.0, 3.0]], dtype=np.float32)
+            with patch.object(emb_mod, '_query_cache', cache), patch.object(emb_mod, '_encoder', mock_encoder):
+                first = emb_mod.encode_query("Total  Revenue?")
+                second = emb_mod.encode_query("total revenue?")
+                
+                np.testing.assert_array_equal(first, second)
+                mock_encoder.encode.assert_called_once()
+                stats = emb_mod.query_cache_stats()
+                assert stats["hits"] == 1
+                assert stats["misses"] == 1
+
+    def test_encode_queries_single_batch(self):
+        """Test many queries are encoded in one call, skipping cached ones."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            import backend.app.src.llm_embedding as emb_mod
+            
+            cache = emb_mod.QueryEmbeddingCache(max_size=8, ttl=60)
+            cache.put((emb_mod.EMBEDDING_MODEL, "cached"), np.array([[9.0, 9.0]], dtype=np.float32))
+            mock_encoder = Mock()
+            mock_encoder.encode.return_value = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+            with patch.object(emb_mod, '_query_cache', cache), patch.object(emb_mod, '_encoder', mock_encoder):
+                result = emb_mod.encode_queries(["a", "cached", "b", "A"])
+                
+                mock_encoder.encode.assert_called_once_with(["a", "b"], convert_to_numpy=True)
+                np.testing.assert_array_equal(result, [[1, 0], [9, 9], [0, 1], [1, 0]])
+
+    def test_query_cache_eviction_and_ttl(self):
+        """Test LRU eviction and TTL expiry of the query cache."""
+        with patch.dict('sys.modules', {
+            'sentence_transformers': MagicMock(),
+            'faiss': MagicMock()
+        }):
+            from backend.app.src.llm_embedding import QueryEmbeddingCache
+            
+            cache = QueryEmbeddingCache(max_size=2, ttl=60)
+            cache.put(("m", "a"), np.zeros((1, 2)))
+            cache.put(("m", "b"), np.ones((1, 2)))
+            assert cache.get(("m", "a")) is not None
+            cache.put(("m", "c"), np.ones((1, 2)))
+            
+            assert cache.get(("m", "b")) is None
+            assert cache.get(("m", "a")) is not None
+            
+            expired = QueryEmbeddingCache(max_size=2, ttl=1)
+            with patch('backend.app.src.llm_embedding.time.monotonic', side_effect=[0.0, 5.0]):
+                expired.put(("m", "a"), np.zeros((1, 2)))
+                assert expired.get(("m", "a")) is None
+            assert expired.stats()["size"] == 0
+
     @patch('backend.app.src.llm_embedding.load_index')
     def test_search_index_no_index(self, mock_load):
         """Test search when no index available."""
@@ -207,7 +732,7 @@ class TestLLMEmbedding:
             
             result = search_index(np.array([[1, 2, 3]]), k=2)
             
-            assert result == []
+            assert result == ([], [])
 
     @patch('backend.app.src.llm_embedding.load_index')
     def test_search_index_success(self, mock_load):
@@ -222,11 +747,11 @@ class TestLLMEmbedding:
             
             from backend.app.src.llm_embedding import search_index
             
-            # Original search_index function signature: search_index(q_emb, k)
             result = search_index(np.array([[1, 2, 3]]), k=2)
             
-            expected = [0, 1]  # Returns list of indices
-            assert result == expected
+            ids, sims = result  # Returns (indices, cosine similarities)
+            assert ids == [0, 1]
+            np.testing.assert_allclose(sims, [0.9, 0.8])
 
     @patch('backend.app.src.llm_embedding.SentenceTransformer')
     def test_encode_texts_empty(self, mock_transformer):
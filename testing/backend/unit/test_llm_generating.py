@@ -142,3 +142,22 @@ class TestLLMGenerating:
                 
                 assert len(results) == 3
                 assert all(isinstance(r, str) for r in results)
+
+    def test_get_llm_loads_once(self):
+        """Test the model is constructed lazily, once, and its load time recorded."""
+        import backend.app.src.llm_generating as gen_mod
+
+        fake_llama = MagicMock()
+        with patch.object(gen_mod, 'Llama', fake_llama), \
+             patch.object(gen_mod, '_llm', None), \
+             patch.dict(gen_mod._llm_status, {"loaded": False, "load_seconds": None, "error": None}):
+            assert gen_mod.model_status()["loaded"] is False
+
+            first = gen_mod.get_llm()
+            second = gen_mod.get_llm()
+
+            assert first is second
+            fake_llama.assert_called_once()
+            status = gen_mod.model_status()
+            assert status["loaded"] is True
+            assert status["load_seconds"] >= 0
@@ -0,0 +1,131 @@
+"""
+Tests for onnx_encoder module.
+"""
+import json
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import backend.app.src.onnx_encoder as onnx_mod
+from backend.app.src.onnx_encoder import DEFAULT_MIN_COSINE, OnnxEncoder, compare_encoders, mean_pool
+
+MODEL_DIR = Path(__file__).resolve().parents[3] / "backend" / "app" / "models" / "all-MiniLM-L6-v2"
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer padding each batch to its longest text."""
+
+    def enable_truncation(self, max_length):
+        self.max_length = max_length
+
+    def enable_padding(self):
+        pass
+
+    def encode_batch(self, texts):
+        toks = [[len(w) for w in t.split()][:self.max_length] for t in texts]
+        width = max(len(t) for t in toks)
+        return [SimpleNamespace(ids=t + [0] * (width - len(t)),
+                                attention_mask=[1] * len(t) + [0] * (width - len(t)),
+                                type_ids=[0] * width) for t in toks]
+
+
+class FakeSession:
+    """Hidden state of token i is [id, 1.0]: pooling yields [mean word length, 1]."""
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, _outputs, feeds):
+        assert set(feeds) == {"input_ids", "attention_mask"}
+        ids = feeds["input_ids"].astype(np.float32)
+        return [np.stack([ids, np.ones_like(ids)], axis=-1)]
+
+
+class TestOnnxEncoder:
+    """Test the ONNX Runtime encoder backend."""
+
+    def test_mean_pool_ignores_padding(self):
+        hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+        mask = np.array([[1, 1, 0]])
+
+        assert np.allclose(mean_pool(hidden, mask, normalize=False), [[2.0, 0.0]])
+        assert np.allclose(mean_pool(hidden, mask), [[1.0, 0.0]])
+
+    def test_encode_batches_and_pools(self, tmp_path):
+        (tmp_path / "modules.json").write_text(json.dumps([{"type": "sentence_transformers.models.Pooling"}]))
+        tokenizers = MagicMock()
+        tokenizers.Tokenizer.from_file.return_value = FakeTokenizer()
+        ort = MagicMock()
+        ort.InferenceSession.return_value = FakeSession()
+        (tmp_path / "model.onnx").write_bytes(b"")
+
+        with patch.dict('sys.modules', {'onnxruntime': ort, 'tokenizers': tokenizers}):
+            enc = OnnxEncoder(tmp_path, tmp_path / "model.onnx", max_seq_length=8, batch_size=2)
+
+        out = enc.encode(["ab abcd", "abc", "a bb ccc"], convert_to_numpy=True)
+
+        assert out.dtype == np.float32
+        assert np.allclose(out, [[3.0, 1.0], [3.0, 1.0], [2.0, 1.0]])
+
+    def test_compare_encoders_reports_agreement(self):
+        rng = np.random.default_rng(0)
+        embs = rng.normal(size=(5, 4)).astype(np.float32)
+        ref = MagicMock()
+        ref.encode.return_value = embs
+        cand = MagicMock()
+        cand.encode.return_value = embs + 1e-4
+
+        report = compare_encoders(ref, cand, ["t"] * 5, repeats=1)
+
+        assert report["n"] == 5
+        assert report["min_cosine"] > 0.999
+        assert report["max_abs_diff"] < 1e-3
+
+    def test_cli_compare_enforces_tolerance(self, tmp_path):
+        """Test `compare` exits non-zero when the ONNX output drifts from torch."""
+        rng = np.random.default_rng(0)
+        embs = rng.normal(size=(3, 4)).astype(np.float32)
+        ref = MagicMock()
+        ref.encode.return_value = embs
+        texts = tmp_path / "texts.txt"
+        texts.write_text("a\nb\nc\n")
+
+        for drift, code in ((1e-4, 0), (1.0, 1)):
+            cand = MagicMock()
+            cand.encode.return_value = embs + rng.normal(scale=drift, size=embs.shape).astype(np.float32)
+            with patch.object(onnx_mod, '_load_reference', return_value=ref), \
+                 patch.object(onnx_mod, 'OnnxEncoder', return_value=cand):
+                assert onnx_mod.main(["compare", "--texts", str(texts), "--repeats", "1", "--min-speedup", "0"]) == code
+            assert cand.encode.call_args[0][0] == ["a", "b", "c"]
+
+    def test_cli_compare_speedup_is_advisory(self, tmp_path):
+        """Test a slow timing alone fails `compare` only when --min-speedup asks for it."""
+        report = {"n": 3, "min_cosine": 0.999, "speedup": 0.5}
+        texts = tmp_path / "texts.txt"
+        texts.write_text("a\nb\nc\n")
+
+        with patch.object(onnx_mod, '_load_reference'), \
+             patch.object(onnx_mod, 'OnnxEncoder'), \
+             patch.object(onnx_mod, 'compare_encoders', return_value=report):
+            assert onnx_mod.main(["compare", "--texts", str(texts)]) == 0
+            assert onnx_mod.main(["compare", "--texts", str(texts), "--min-speedup", "1"]) == 1
+
+    def test_exported_model_matches_torch(self, tmp_path):
+        """Test the int8 export stays within tolerance of the torch model (needs the model)."""
+        for module in ("torch", "transformers", "sentence_transformers", "onnxruntime", "tokenizers"):
+            pytest.importorskip(module)
+        if not (MODEL_DIR / "tokenizer.json").exists():
+            pytest.skip("embedding model not present")
+
+        onnx_path = onnx_mod.export_onnx(MODEL_DIR, tmp_path / "model_qint8.onnx")
+        report = compare_encoders(onnx_mod._load_reference(MODEL_DIR), OnnxEncoder(MODEL_DIR, onnx_path),
+                                  onnx_mod.SAMPLE_TEXTS, repeats=1)
+
+        assert report["min_cosine"] >= DEFAULT_MIN_COSINE
@@ -68,23 +68,157 @@ class TestRetrievalModule:
         assert len(scores) == 3
         assert all(isinstance(s, float) for s in scores)
         
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_bm25_postings(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test BM25 inverted index and scoring over postings."""
+        from backend.app.src.retrieval import BM25, _tokenize
+        
+        corpus = ["revenue growth revenue", "cost growth", "headcount"]
+        bm25 = BM25(corpus)
+        
+        term = _tokenize("revenue")[0]
+        ids, weights = bm25.postings(term)
+        assert ids.tolist() == [0]
+        assert weights[0] > 0.0
+        assert bm25.tf[0, bm25.vocab[term]] == 2.0
+        
+        scores = bm25.score("revenue growth")
+        assert scores[0] > scores[1] > 0.0
+        assert scores[2] == 0.0
+        
+        assert bm25.postings("missing")[0].size == 0
+
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_tokenize_batch_and_jaccard(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test batch tokenization and cached-token Jaccard match the per-text versions."""
+        from backend.app.src.retrieval import BM25, _tokenize, tokenize_batch
+
+        corpus = ["Operating Revenue: 120; Region: North", "", "Closing prices rose 5%", "revenue revenue costs"]
+        assert tokenize_batch(corpus) == [_tokenize(t) for t in corpus]
+
+        bm25 = BM25(corpus)
+        query = "revenue by region and costs"
+        qset = set(_tokenize(query))
+        expected = [len(qset & set(_tokenize(t))) / (len(qset | set(_tokenize(t))) or 1) for t in corpus]
+        np.testing.assert_allclose(bm25.jaccard(query, np.arange(4)), expected, rtol=1e-6)
+        assert bm25.jaccard("", np.array([0, 1])).tolist() == [0.0, 0.0]
+
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_bm25_score_batch(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test batched BM25 scoring matches per-query scoring."""
+        from backend.app.src.retrieval import BM25
+        
+        corpus = ["revenue growth revenue", "cost growth", "headcount", ""]
+        bm25 = BM25(corpus)
+        queries = ["revenue", "growth headcount", "unknown term"]
+        
+        batch = bm25.score_batch(queries)
+        
+        assert batch.shape == (3, 4)
+        for row, q in zip(batch, queries):
+            np.testing.assert_allclose(row, bm25.score_array(q))
+        assert bm25.score_batch([]).shape == (0, 4)
+        
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_bm25_top_k_matches_exhaustive(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test MaxScore top-k returns the same best documents as full scoring."""
+        from backend.app.src.retrieval import BM25
+        
+        rng = np.random.default_rng(0)
+        vocab = [f"term{i}" for i in range(40)]
+        probs = 1.0 / np.arange(1, 41)
+        probs /= probs.sum()
+        corpus = [" ".join(rng.choice(vocab, size=rng.integers(1, 12), p=probs)) for _ in range(500)]
+        bm25 = BM25(corpus)
+        
+        for query in ["term0 term1 term2", "term35 term0", "term7"]:
+            full = np.asarray(bm25.score(query))
+            ids, scores = bm25.top_k(query, 10)
+            expected = np.sort(full[full > 0])[::-1][:10]
+            np.testing.assert_allclose(scores, expected)
+            np.testing.assert_allclose(full[ids], scores)
+            np.testing.assert_allclose(bm25.score_docs(query, ids), scores)
+        
+        ids, scores = bm25.top_k("missing", 10)
+        assert ids.size == 0
+        
+        allowed = np.arange(100, 200)
+        full = np.asarray(bm25.score("term0 term1"))
+        ids, scores = bm25.top_k("term0 term1", 5, allowed)
+        assert set(ids.tolist()) <= set(allowed.tolist())
+        np.testing.assert_allclose(scores, np.sort(full[allowed])[::-1][:5])
+        
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_exhaustive_mode(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test the exhaustive BM25 mode selects the same chunk as MaxScore."""
+        mock_load.return_value = None
+        mock_encode_query.return_value = np.array([[0.1, 0.2, 0.3]])
+        mock_search.return_value = []
+        mock_encode_texts.return_value = np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])
+        
+        from backend.app.src.retrieval import retrieve_with_fallback
+        
+        chunks = ["machine learning is great", "deep learning algorithms"]
+        fast = retrieve_with_fallback("machine learning", chunks, k=1, bm25_mode="maxscore")
+        full = retrieve_with_fallback("machine learning", chunks, k=1, bm25_mode="exhaustive")
+        
+        assert fast[0] == full[0]
+        
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_reuses_bm25(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test that a prebuilt BM25 index is reused instead of rebuilt."""
+        mock_load.return_value = None
+        mock_encode_query.return_value = np.array([[0.1, 0.2, 0.3]])
+        mock_search.return_value = []
+        mock_encode_texts.return_value = np.array([[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])
+        
+        from backend.app.src.retrieval import BM25, retrieve_with_fallback
+        
+        chunks = ["machine learning is great", "deep learning algorithms"]
+        bm25 = BM25(chunks)
+        
+        with patch('backend.app.src.retrieval.BM25') as mock_bm25:
+            indices, texts, score = retrieve_with_fallback("machine learning", chunks, k=2, bm25=bm25)
+            mock_bm25.assert_not_called()
+        
+        assert 0 in indices
+        
     @patch('backend.app.src.retrieval.encode_query')
     @patch('backend.app.src.retrieval.encode_texts') 
     @patch('backend.app.src.retrieval.load_index')
     @patch('backend.app.src.retrieval.search_index')
     def test_normalize_function(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
-        """Test normalize function."""
-        from backend.app.src.retrieval import _normalize
+        """Test min-max normalization."""
+        from backend.app.src.retrieval import _minmax
         
         values = [1.0, 2.0, 3.0, 4.0, 5.0]
-        result = _normalize(values)
+        result = _minmax(values)
         
         assert len(result) == 5
         assert min(result) == 0.0
         assert max(result) == 1.0
+        assert _minmax([2.0, 2.0]).tolist() == [0.5, 0.5]
         
-        result = _normalize([])
-        assert result == []
+        result = _minmax([])
+        assert result.tolist() == []
         
     @patch('backend.app.src.retrieval.encode_query')
     @patch('backend.app.src.retrieval.encode_texts') 
@@ -109,6 +243,309 @@ class TestRetrievalModule:
         assert isinstance(score, float)
         assert score >= 0.0
         
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_stored_embeddings(self, mock_search, mock_load, mock_encode_texts, mock_encode_query, mock_load_embs):
+        """Test reranking uses stored chunk embeddings instead of re-encoding."""
+        mock_load.return_value = None
+        mock_search.return_value = []
+        mock_encode_query.return_value = np.array([[0.0, 1.0, 0.0]], dtype=np.float32)
+        mock_load_embs.return_value = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float32)
+        
+        from backend.app.src.retrieval import retrieve_with_fallback
+        
+        chunks = ["learning rate schedule", "learning curve"]
+        indices, texts, score = retrieve_with_fallback("learning", chunks, k=1)
+        
+        mock_encode_texts.assert_not_called()
+        assert indices == [1]
+        
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_fusion_modes(self, mock_search, mock_load, mock_encode_texts, mock_encode_query, mock_load_embs):
+        """Test weighted and RRF fusion consume FAISS similarities directly."""
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_query.return_value = np.array([[0.0, 1.0, 0.0]], dtype=np.float32)
+        # FAISS ranks chunk 2 first; -1 is padding and must be ignored
+        mock_search.return_value = ([2, 0, -1], [0.9, 0.1, -3.4e38])
+        
+        from backend.app.src.retrieval import retrieve_with_fallback
+        
+        chunks = ["quarterly revenue north", "headcount", "sales by region"]
+        for fusion in ("weighted", "rrf"):
+            indices, texts, score = retrieve_with_fallback(
+                "revenue", chunks, k=2, fusion=fusion, answer_threshold=0.0
+            )
+            assert set(indices) == {0, 2}
+            assert 0.0 <= score <= 1.0
+        
+        mock_encode_texts.assert_not_called()
+        
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_weighted_fusion_encodes_bm25_only_candidates(self, mock_search, mock_load, mock_encode_texts, mock_encode_query, mock_load_embs):
+        """Test candidates FAISS did not score are encoded in one call, not given a floor similarity."""
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_query.return_value = np.array([[0.0, 1.0, 0.0]], dtype=np.float32)
+        mock_search.return_value = ([1, 2], [0.3, 0.2])
+        mock_encode_texts.side_effect = lambda texts: np.array(
+            [[0.0, 1.0, 0.0] if "forecast" in t else [1.0, 0.0, 0.0] for t in texts], dtype=np.float32)
+
+        from backend.app.src.retrieval import retrieve_with_fallback
+
+        chunks = ["quarterly revenue north", "headcount", "sales by region", "revenue forecast"]
+        indices, texts, score = retrieve_with_fallback(
+            "revenue", chunks, k=1, fusion="weighted", answer_threshold=0.0
+        )
+
+        mock_encode_texts.assert_called_once()
+        assert sorted(mock_encode_texts.call_args[0][0]) == ["quarterly revenue north", "revenue forecast"]
+        assert indices == [3]
+
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_rrf_scaling(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test RRF scores are scaled so a double rank-1 hit scores 1.0."""
+        from backend.app.src.retrieval import _rrf
+        
+        scores = _rrf([3, 5, 7], [3, 5], [3, 7], 0.5, 0.5, 60)
+        
+        assert scores[0] == pytest.approx(1.0)
+        assert scores[1] == pytest.approx(scores[2])
+        
+    @patch('backend.app.src.retrieval.search_index_many')
+    @patch('backend.app.src.retrieval.encode_queries')
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_many_matches_single(self, mock_search, mock_load, mock_encode_texts, mock_encode_query,
+                                          mock_load_embs, mock_encode_queries, mock_search_many):
+        """Test batched retrieval returns the same results as per-query retrieval."""
+        q_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        hits = ([[1, 0], [2, -1]], [[0.8, 0.2], [0.7, 0.0]])
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_queries.return_value = q_embs
+        mock_search_many.return_value = hits
+        mock_encode_query.side_effect = [q_embs[:1], q_embs[1:]]
+        mock_search.side_effect = [(hits[0][0], hits[1][0]), (hits[0][1], hits[1][1])]
+        
+        from backend.app.src.retrieval import retrieve_many, retrieve_with_fallback
+        
+        chunks = ["revenue north", "revenue south", "headcount by region"]
+        queries = ["revenue", "headcount"]
+        
+        batch = retrieve_many(queries, chunks, k=2, answer_threshold=0.0)
+        single = [retrieve_with_fallback(q, chunks, k=2, answer_threshold=0.0) for q in queries]
+        
+        mock_encode_queries.assert_called_once_with(queries)
+        mock_search_many.assert_called_once()
+        assert len(batch) == 2
+        for got, expected in zip(batch, single):
+            assert got[0] == expected[0]
+            assert got[2] == pytest.approx(expected[2])
+        
+        assert retrieve_many([], chunks) == []
+        assert retrieve_many(queries, []) == [([], [], 0.0), ([], [], 0.0)]
+        
+    @patch('backend.app.src.retrieval.search_index_many')
+    @patch('backend.app.src.retrieval.encode_queries')
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_many_searches_narrowed_queries_once(self, mock_search, mock_load, mock_encode_texts, mock_encode_query,
+                                                         mock_load_embs, mock_encode_queries, mock_search_many):
+        """Test prefiltered queries skip the unfiltered batch search."""
+        q_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_queries.return_value = q_embs
+        mock_encode_texts.side_effect = lambda texts: np.ones((len(texts), 2), dtype=np.float32)
+        mock_search_many.return_value = ([[1, 0]], [[0.8, 0.2]])
+        mock_search.return_value = ([3], [0.9])
+
+        from backend.app.src.retrieval import WorkbookMetadata, retrieve_many
+
+        chunks = [
+            "[Sales] Month: Jan; Total: 5",
+            "[Sales] Month: Feb; Total: 7",
+            "[Costs] Month: Jan; Total: 2",
+            "[Costs] Month: Feb; Total: 3",
+        ]
+        meta = WorkbookMetadata()
+        meta.add_sheet("Sales", ["Month", "Total"], 0, 2)
+        meta.add_sheet("Costs", ["Month", "Total"], 2, 4)
+
+        retrieve_many(["total in feb", "costs total in feb"], chunks, k=2, answer_threshold=0.0, metadata=meta)
+
+        np.testing.assert_array_equal(mock_search_many.call_args[0][0], q_embs[:1])
+        mock_search.assert_called_once()
+        np.testing.assert_array_equal(mock_search.call_args[0][0], q_embs[1:])
+        assert mock_search.call_args.kwargs["allowed_ids"].tolist() == [2, 3]
+
+    @patch('backend.app.src.retrieval.search_index_many')
+    @patch('backend.app.src.retrieval.encode_queries')
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index', None)
+    def test_retrieve_many_keeps_prefilter_without_filtered_search(self, mock_load, mock_encode_texts,
+                                                                   mock_load_embs, mock_encode_queries, mock_search_many):
+        """Test narrowed queries keep their filter when there is no filtered search."""
+        q_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_queries.return_value = q_embs
+        mock_encode_texts.side_effect = lambda texts: np.ones((len(texts), 2), dtype=np.float32)
+        mock_search_many.side_effect = lambda q, k: ([[1, 0]] * len(q), [[0.8, 0.2]] * len(q))
+
+        from backend.app.src.retrieval import WorkbookMetadata, retrieve_many
+
+        chunks = [
+            "[Sales] Month: Jan; Total: 5",
+            "[Sales] Month: Feb; Total: 7",
+            "[Costs] Month: Jan; Total: 2",
+            "[Costs] Month: Feb; Total: 3",
+        ]
+        meta = WorkbookMetadata()
+        meta.add_sheet("Sales", ["Month", "Total"], 0, 2)
+        meta.add_sheet("Costs", ["Month", "Total"], 2, 4)
+
+        results = retrieve_many(["total in feb", "costs total in feb"], chunks, k=2, answer_threshold=0.0, metadata=meta)
+
+        assert mock_search_many.call_count == 2
+        # The Sales rows the unfiltered search found are outside the Costs filter
+        assert set(results[1][0]) <= {2, 3}
+        assert 1 in results[0][0]
+
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_workbook_metadata_match(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test sheet and column mentions narrow the chunk range."""
+        from backend.app.src.retrieval import WorkbookMetadata
+        
+        meta = WorkbookMetadata()
+        meta.add_sheet("Income Statement", ["Month", "Revenue"], 0, 3)
+        meta.add_sheet("Headcount", ["Month", "Employees"], 3, 5)
+        
+        assert meta.match("income statement for March").tolist() == [0, 1, 2]
+        assert meta.match("how many employees").tolist() == [3, 4]
+        assert meta.match("revenue by month").tolist() == [0, 1, 2]
+        # Column present in every sheet, or nothing mentioned: no filter
+        assert meta.match("month") is None
+        assert meta.match("anything else") is None
+        
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts') 
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_metadata_prefilter(self, mock_search, mock_load, mock_encode_texts, mock_encode_query, mock_load_embs):
+        """Test the prefilter restricts BM25 and FAISS to the mentioned sheet."""
+        mock_load.return_value = Mock()
+        mock_load_embs.return_value = None
+        mock_encode_query.return_value = np.array([[0.0, 1.0]], dtype=np.float32)
+        mock_search.return_value = ([3], [0.9])
+        mock_encode_texts.side_effect = lambda texts: np.ones((len(texts), 2), dtype=np.float32)
+        
+        from backend.app.src.retrieval import WorkbookMetadata, retrieve_with_fallback
+        
+        chunks = [
+            "[Sales] Month: Jan; Total: 5",
+            "[Sales] Month: Feb; Total: 7",
+            "[Costs] Month: Jan; Total: 2",
+            "[Costs] Month: Feb; Total: 3",
+        ]
+        meta = WorkbookMetadata()
+        meta.add_sheet("Sales", ["Month", "Total"], 0, 2)
+        meta.add_sheet("Costs", ["Month", "Total"], 2, 4)
+        
+        indices, _, _ = retrieve_with_fallback(
+            "costs total in feb", chunks, k=4, answer_threshold=0.0, metadata=meta
+        )
+        
+        assert mock_search.call_args.kwargs["allowed_ids"].tolist() == [2, 3]
+        assert set(indices) <= {2, 3}
+        
+        retrieve_with_fallback("costs total in feb", chunks, k=4, answer_threshold=0.0, metadata=meta, prefilter=False)
+        assert mock_search.call_args.kwargs["allowed_ids"] is None
+
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_range_index_match(self, mock_search, mock_load, mock_encode_texts, mock_encode_query):
+        """Test numeric and date predicates resolve against typed columns."""
+        import pandas as pd
+        from backend.app.src.retrieval import RangeIndex
+
+        df = pd.DataFrame({
+            "Month": pd.date_range("2023-01-01", periods=6, freq="MS"),
+            "Revenue": [1.0e6, 2.5e6, 1.8e6, 3.2e6, np.nan, 2.0e6],
+            "Region": ["N", "S", "N", "S", "N", "S"],
+        })
+        ranges = RangeIndex()
+        ranges.add_sheet("Sales", df, 10)
+
+        assert len(ranges) == 2
+        assert ranges.match("which months had revenue above 2M").tolist() == [11, 13]
+        assert ranges.match("revenue between 1,800,000 and 2m").tolist() == [12, 15]
+        assert ranges.match("revenue at least 2m").tolist() == [11, 13, 15]
+        # Date predicates apply to every date column when none is named
+        assert ranges.match("anything before 2023-03-01").tolist() == [10, 11]
+        assert ranges.match("sales during 2023-04").tolist() == [13]
+        assert ranges.match("revenue over 2m after 2023-02").tolist() == [13]
+        # Numeric predicates need a named column; no predicate means no stage
+        assert ranges.match("anything above 2m") is None
+        assert ranges.match("total revenue") is None
+
+    @patch('backend.app.src.retrieval.load_embeddings')
+    @patch('backend.app.src.retrieval.encode_query')
+    @patch('backend.app.src.retrieval.encode_texts')
+    @patch('backend.app.src.retrieval.load_index')
+    @patch('backend.app.src.retrieval.search_index')
+    def test_retrieve_with_fallback_range_candidates(self, mock_search, mock_load, mock_encode_texts, mock_encode_query, mock_load_embs):
+        """Test rows matching a range predicate join the pool and rank first."""
+        mock_load.return_value = None
+        mock_load_embs.return_value = None
+        mock_encode_query.return_value = np.array([[0.0, 1.0]], dtype=np.float32)
+        mock_encode_texts.return_value = np.ones((6, 2), dtype=np.float32)
+
+        import pandas as pd
+        from backend.app.src.retrieval import WorkbookMetadata, retrieve_with_fallback
+
+        df = pd.DataFrame({"Month": ["Jan", "Feb", "Mar", "Apr", "May", "Jun"], "Revenue": [1, 5, 2, 9, 3, 4]})
+        chunks = [f"Month: {m}; Revenue: {v}" for m, v in zip(df["Month"], df["Revenue"])]
+        meta = WorkbookMetadata()
+        meta.add_sheet("Sales", list(df.keys()), 0, len(chunks))
+        meta.ranges.add_sheet("Sales", df, 0)
+
+        indices, _, score = retrieve_with_fallback("months with revenue above 4", chunks, k=2, metadata=meta)
+        assert sorted(indices) == [1, 3]
+        assert score > 0.15
+
+        indices, _, _ = retrieve_with_fallback("months with revenue above 4", chunks, k=2, metadata=meta, range_boost=0.0)
+        assert sorted(indices) != [1, 3]
+
     @patch('backend.app.src.retrieval.encode_query')
     @patch('backend.app.src.retrieval.encode_texts') 
     @patch('backend.app.src.retrieval.load_index')
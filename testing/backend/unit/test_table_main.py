@@ -36,6 +36,191 @@ class TestTableMainFunctionality:
         retrieved_chunks = get_current_chunks()
         assert retrieved_chunks == test_chunks
         
+    def test_set_current_chunks_builds_bm25(self):
+        """Test that setting chunks builds the lexical index once."""
+        from backend.app.src.table_main import set_current_chunks, get_current_bm25
+        
+        set_current_chunks(["chunk1", "chunk2"])
+        assert get_current_bm25() is not None
+        
+        set_current_chunks([])
+        assert get_current_bm25() is None
+        
+    def test_retrieve_batch(self):
+        """Test batch retrieval against the current workbook."""
+        sys.modules['retrieval'].retrieve_many.return_value = [([0], ["chunk1"], 0.9), ([], [], 0.0)]
+        
+        from backend.app.src.table_main import retrieve_batch, set_current_chunks
+        
+        set_current_chunks([])
+        assert retrieve_batch(["q1", "q2"]) == [([], [], 0.0), ([], [], 0.0)]
+        
+        set_current_chunks(["chunk1", "chunk2"])
+        result = retrieve_batch(["q1", "q2"], k=1)
+        assert result[0] == ([0], ["chunk1"], 0.9)
+        assert sys.modules['retrieval'].retrieve_many.call_args.kwargs["k"] == 1
+        
+    def test_retrieval_cache(self):
+        """Test repeated prompts reuse retrieval until the workbook changes."""
+        retrieve = sys.modules['retrieval'].retrieve_with_fallback
+        retrieve.return_value = ([0], ["revenue data"], 0.8)
+        sys.modules['llm_generating'].generate_answer.return_value = "Cached answer."
+
+        from backend.app.src.table_main import rag_pipeline, set_current_chunks
+
+        set_current_chunks(["revenue data", "expense data"])
+        retrieve.reset_mock()
+        rag_pipeline("What is the revenue?")
+        rag_pipeline("  what is the REVENUE? ")
+        assert retrieve.call_count == 1
+
+        rag_pipeline("What is the revenue?", k=2)
+        assert retrieve.call_count == 2
+
+        set_current_chunks(["revenue data", "profit data"])
+        rag_pipeline("What is the revenue?")
+        assert retrieve.call_count == 3
+
+    def test_workbook_registry_reuse_and_eviction(self, tmp_path):
+        """Test reopening an unchanged workbook skips parsing and embedding."""
+        import backend.app.src.table_main as tm
+
+        book_a = tmp_path / "a.xlsx"
+        book_b = tmp_path / "b.xlsx"
+        book_a.write_bytes(b"workbook a")
+        book_b.write_bytes(b"workbook b")
+        parsed = {str(book_a): ["a1", "a2"], str(book_b): ["b1"]}
+
+        with patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)), \
+             patch.object(tm, 'workbook_index_path', side_effect=lambda key: tmp_path / key / "index.pkl"), \
+             patch.object(tm, 'load_excel_workbook', side_effect=lambda p: (parsed[p], None)) as mock_load, \
+             patch.object(tm, 'update_index') as mock_build, \
+             patch.object(tm, 'index_state', return_value=(None, None, None, None)), \
+             patch.object(tm, 'ENCODER_ID', 'model-a'), \
+             patch.object(tm, 'load_index_spec', return_value={"factory": "Flat"}), \
+             patch.object(tm, 'index_spec_mismatch', return_value=None), \
+             patch.object(tm, 'use_index'):
+            assert tm.open_workbook(str(book_a)) == (["a1", "a2"], False)
+            assert tm.open_workbook(str(book_b)) == (["b1"], False)
+            assert tm.open_workbook(str(book_a)) == (["a1", "a2"], True)
+            assert mock_load.call_count == 2
+            assert mock_build.call_count == 2
+            assert tm.get_current_chunks() == ["a1", "a2"]
+
+            assert tm.use_workbook(str(book_b))
+            assert tm.get_current_chunks() == ["b1"]
+            assert not tm.use_workbook(str(tmp_path / "missing.xlsx"))
+
+            # A batch against another workbook leaves the current one in place
+            retrieve_many = sys.modules['retrieval'].retrieve_many
+            retrieve_many.reset_mock()
+            retrieve_many.return_value = [([0], ["a1"], 0.9)]
+            assert tm.retrieve_batch(["q"], k=1, workbook=str(book_a)) == [([0], ["a1"], 0.9)]
+            assert retrieve_many.call_args.args[1] == ["a1", "a2"]
+            assert tm.get_current_chunks() == ["b1"]
+            assert tm._registry.active.path == str(book_b)
+            assert tm.retrieve_batch(["q"], workbook=str(tmp_path / "missing.xlsx")) is None
+
+            # So does a targeted prompt
+            retrieve_with_fallback = sys.modules['retrieval'].retrieve_with_fallback
+            retrieve_with_fallback.reset_mock()
+            retrieve_with_fallback.return_value = ([0], ["a1"], 0.9)
+            tm._retrieval_cache.clear()
+            tm.rag_pipeline("a1", workbook=str(book_a))
+            assert retrieve_with_fallback.call_args.args[1] == ["a1", "a2"]
+            assert tm.get_current_chunks() == ["b1"]
+            assert tm._registry.active.path == str(book_b)
+            assert tm.rag_pipeline("q", workbook=str(tmp_path / "missing.xlsx"))[0] == []
+            assert tm._registry.active.path == str(book_b)
+
+            # Over budget: everything but the active workbook drops to disk
+            tm._registry.budget_bytes = 0
+            tm._registry._evict()
+            stats = {w["path"]: w["resident"] for w in tm.workbook_registry_stats()["workbooks"]}
+            assert stats == {str(book_a): False, str(book_b): True}
+
+            assert tm.use_workbook(str(book_a))
+            assert tm.get_current_chunks() == ["a1", "a2"]
+            assert mock_build.call_count == 2
+
+    def test_workbook_snapshot_survives_restart(self, tmp_path):
+        """Test a restarted backend reuses the snapshot unless the file, embedding model or index config changed."""
+        import backend.app.src.table_main as tm
+
+        book = tmp_path / "a.xlsx"
+        book.write_bytes(b"workbook a")
+        # What build_index would pick now; a build records it as the index spec
+        config = {"factory": "Flat"}
+
+        with patch.object(tm, 'workbook_index_path', side_effect=lambda key: tmp_path / key / "index.pkl"), \
+             patch.object(tm, 'load_excel_workbook', return_value=(["a1", "a2"], None)) as mock_load, \
+             patch.object(tm, 'update_index') as mock_update, \
+             patch.object(tm, 'index_state', return_value=(None, None, None, None)), \
+             patch.object(tm, 'load_index_spec', side_effect=lambda path: dict(config)), \
+             patch.object(tm, 'index_spec_mismatch', side_effect=lambda spec, n: None if spec == config else "changed"), \
+             patch.object(tm, 'use_index'):
+            with patch.object(tm, 'ENCODER_ID', 'model-a'):
+                with patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                    assert tm.open_workbook(str(book)) == (["a1", "a2"], False)
+                slot = tm.WorkbookEntry(str(book.resolve()), "").manifest_path.parent
+                (slot / "index.pkl").write_bytes(b"index")
+                assert (slot / "manifest.json").exists()
+
+                # Restart: an empty registry, same file
+                with patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                    assert tm.open_workbook(str(book)) == (["a1", "a2"], True)
+                assert mock_load.call_count == 1
+
+            # Another embedding model: the stored index is dropped and rebuilt
+            with patch.object(tm, 'ENCODER_ID', 'model-b'), \
+                 patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                assert tm.open_workbook(str(book)) == (["a1", "a2"], False)
+                assert not (slot / "index.pkl").exists()
+                assert mock_update.call_count == 2
+                assert tm.WorkbookEntry(str(book.resolve()), "").read_manifest()["encoder"] == "model-b"
+
+            # Another FAISS_INDEX config: same as another model
+            (slot / "index.pkl").write_bytes(b"index")
+            config["factory"] = "HNSW32"
+            with patch.object(tm, 'ENCODER_ID', 'model-b'), \
+                 patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                assert tm.open_workbook(str(book)) == (["a1", "a2"], False)
+                assert not (slot / "index.pkl").exists()
+                assert mock_update.call_count == 3
+                assert tm.WorkbookEntry(str(book.resolve()), "").read_manifest()["index"] == {"factory": "HNSW32"}
+
+            # An index whose chunk ids cannot be read is rebuilt, not searched blind
+            with patch.object(tm, 'ENCODER_ID', 'model-b'), \
+                 patch.object(tm, 'load_chunk_ids', return_value=None), \
+                 patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                assert tm.open_workbook(str(book)) == (["a1", "a2"], False)
+                assert mock_update.call_count == 4
+
+            # A snapshot pickled against classes that have since moved is rebuilt, not fatal
+            with patch.object(tm, 'ENCODER_ID', 'model-b'), \
+                 patch.object(tm, '_registry', tm.WorkbookRegistry(2**30)):
+                with patch.object(tm.pickle, 'load', side_effect=ModuleNotFoundError("No module named 'old_retrieval'")):
+                    assert tm.open_workbook(str(book)) == (["a1", "a2"], False)
+                assert mock_load.call_count == 5
+                assert tm.WorkbookEntry(str(book.resolve()), "").read_manifest() is not None
+
+    def test_term_coverage(self):
+        """Test exact and prefix matches against a chunk's sorted terms."""
+        from backend.app.src.table_main import _chunk_terms, _evidence_tokens, _term_coverage
+
+        terms = _chunk_terms("Date: 2024-03-01; Closing Price: 182.5; Volume: 1200")
+        assert terms == tuple(sorted(terms))
+
+        assert _term_coverage(set(_evidence_tokens("closing price")), terms) == 1.0
+        # "vol" is too short for a prefix match; "volumes" stems to "volume"
+        assert _term_coverage({"vol"}, terms) == 0.0
+        assert _term_coverage(set(_evidence_tokens("volumes")), terms) == 1.0
+        # Query term extends a chunk term, and vice versa
+        assert _term_coverage({"volumetric"}, terms) == 1.0
+        assert _term_coverage({"clos"}, terms) == 1.0
+        assert _term_coverage({"revenue", "price"}, terms) == 0.5
+        assert _term_coverage(set(), terms) == 0.0
+
     def test_query_current_data(self):
         """Test rag_pipeline functionality."""
         sys.modules['retrieval'].retrieve_with_fallback.return_value = ([0, 1], ["chunk1", "chunk2"], 0.8)